@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: current extract_blocks vs. the original per-line dict version.
+
+    python bench_extract.py [pdf_dir] [--repeat N]
+
+Both versions run over every PDF in the directory; outputs are checked to
+be identical before timings are reported. Besides end-to-end times, the
+line walkers are timed alone on pre-parsed get_text("dict") output, since
+PyMuPDF parsing dominates on short documents and hides the walker cost.
+"""
+import argparse
+import os
+import re
+import time
+from collections import Counter
+from functools import partial
+
+import fitz  # PyMuPDF
+
+from extract_candidates import extract_blocks, normalize_text, page_blocks, text_flags
+
+def legacy_extract_blocks(pdf_path):
+    """The original extract_blocks, kept verbatim as the benchmark baseline."""
+    doc = fitz.open(pdf_path)
+    raw = []
+    font_sizes = []
+    text_colors = []  # Track text colors
+
+    for page in doc:
+        page_height = page.rect.height
+
+        for b in page.get_text("dict")["blocks"]:
+            if b["type"] != 0:
+                continue
+            for line in b["lines"]:
+                spans = sorted(line["spans"], key=lambda s: s["origin"][0])
+                if not spans:
+                    continue
+
+                first = spans[0]
+                fs = first["size"]
+                fname = first["font"]
+                text_color = first.get("color", 0)  # Get text color (0 is typically black)
+                is_bold = bool(re.search(r"bold|black", fname, re.IGNORECASE))
+                x0, y0 = first["origin"]
+
+                # Skip likely headers/footers based on position
+                if y0 < (page_height * 0.05) or y0 > (page_height * 0.95):
+                    continue
+
+                # merge spans
+                text = ""
+                for sp in spans:
+                    chunk = sp["text"].strip()
+                    if not chunk:
+                        continue
+                    if text and not re.match(r"[,\.\)\]]", chunk):
+                        text += " "
+                    text += chunk
+                text = text.strip()
+                if not text:
+                    continue
+
+                text = normalize_text(text)
+
+                raw.append({
+                    "text": text,
+                    "page": page.number + 1,
+                    "font_size": fs,
+                    "is_bold": int(is_bold),
+                    "text_color": text_color,
+                    "x": int(x0),
+                    "y": int(y0),
+                    "char_length": len(text),
+                })
+                font_sizes.append(fs)
+                text_colors.append(text_color)
+
+    doc.close()
+    body_font = Counter(font_sizes).most_common(1)[0][0] if font_sizes else None
+    # Determine the most common text color (body text color)
+    body_color = Counter(text_colors).most_common(1)[0][0] if text_colors else 0
+
+    return raw, body_font, body_color
+
+def legacy_page_walk(page_dict, page_number, page_height):
+    """The original per-line loop body for one parsed page."""
+    raw = []
+    for b in page_dict["blocks"]:
+        if b["type"] != 0:
+            continue
+        for line in b["lines"]:
+            spans = sorted(line["spans"], key=lambda s: s["origin"][0])
+            if not spans:
+                continue
+
+            first = spans[0]
+            fs = first["size"]
+            fname = first["font"]
+            text_color = first.get("color", 0)
+            is_bold = bool(re.search(r"bold|black", fname, re.IGNORECASE))
+            x0, y0 = first["origin"]
+
+            if y0 < (page_height * 0.05) or y0 > (page_height * 0.95):
+                continue
+
+            text = ""
+            for sp in spans:
+                chunk = sp["text"].strip()
+                if not chunk:
+                    continue
+                if text and not re.match(r"[,\.\)\]]", chunk):
+                    text += " "
+                text += chunk
+            text = text.strip()
+            if not text:
+                continue
+
+            text = normalize_text(text)
+
+            raw.append({
+                "text": text,
+                "page": page_number,
+                "font_size": fs,
+                "is_bold": int(is_bold),
+                "text_color": text_color,
+                "x": int(x0),
+                "y": int(y0),
+                "char_length": len(text),
+            })
+    return raw
+
+def _parse_pages(paths):
+    pages = []
+    flags = text_flags()
+    for path in paths:
+        doc = fitz.open(path)
+        for page in doc:
+            pages.append((page.get_text("dict", flags=flags), page.number + 1, page.rect.height))
+        doc.close()
+    return pages
+
+FIELDS = ("text", "page", "font_size", "is_bold", "text_color", "x", "y", "char_length")
+
+def _as_rows(blocks):
+    if isinstance(blocks, list):
+        return [tuple(b[f] for f in FIELDS) for b in blocks]
+    return list(blocks.rows())
+
+def _best_time(fn, items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(*item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _report(label, legacy, current, lines):
+    print(f"⏱ {label}")
+    print(f"   legacy:  {legacy:.4f}s ({lines / legacy:,.0f} lines/s)")
+    print(f"   current: {current:.4f}s ({lines / current:,.0f} lines/s)")
+    print(f"   🚀 speed-up: {legacy / current:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf_dir", nargs="?", default="input")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per version (best is reported)")
+    args = parser.parse_args()
+
+    paths = [
+        os.path.join(args.pdf_dir, f) for f in sorted(os.listdir(args.pdf_dir))
+        if f.lower().endswith(".pdf")
+    ]
+    if not paths:
+        raise FileNotFoundError(f"No PDFs found in {args.pdf_dir}")
+
+    # The legacy version has no running header/footer detection: compare like with like
+    current_extract_blocks = partial(extract_blocks, drop_repeated=False)
+    lines = 0
+    for path in paths:
+        new_blocks, new_font, new_color = current_extract_blocks(path)
+        old_blocks, old_font, old_color = legacy_extract_blocks(path)
+        if _as_rows(new_blocks) != _as_rows(old_blocks) or (new_font, new_color) != (old_font, old_color):
+            raise AssertionError(f"extract_blocks output differs from the legacy version on {path}")
+        lines += len(new_blocks)
+
+    print(f"📄 {len(paths)} PDFs, {lines} lines, best of {args.repeat}")
+    files = [(path,) for path in paths]
+    _report("extract_blocks end to end",
+            _best_time(legacy_extract_blocks, files, args.repeat),
+            _best_time(current_extract_blocks, files, args.repeat), lines)
+
+    pages = _parse_pages(paths)
+    _report("line walker on pre-parsed pages",
+            _best_time(legacy_page_walk, pages, args.repeat),
+            _best_time(lambda d, n, h: page_blocks(d, n, h, {}), pages, args.repeat), lines)
+
+if __name__ == "__main__":
+    main()
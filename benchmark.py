@@ -0,0 +1,342 @@
+"""
+Reproducible benchmark suite on a synthetic PDF corpus.
+
+    python benchmark.py --scales 5,20,80 --documents 4 --output bench.json
+    python benchmark.py --scales 5,20,80 --documents 4 --baseline bench.json
+
+For every scale (pages per document) a corpus is generated with PyMuPDF
+from a fixed seed: body text in a regular font, headings in a larger bold
+font at a chosen density, in one of several Latin-script languages. Each
+stage (extract_blocks, is_likely_heading, HeadingDetector,
+PersonaEmbedder.embed, rank_sections) is timed over --repeats runs and the
+full outline_extractor.py pipeline is run as a subprocess. Results hold
+latency percentiles, throughput and peak memory (tracemalloc peak for
+in-process stages, peak RSS for the pipeline process) and are written as
+JSON. With --baseline, p50 latencies are compared against an earlier
+result file and regressions beyond --tolerance fail the run.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from extract_candidates import extract_blocks, likely_heading_indices, page_count
+from utils import HeadingDetector, classify_headings
+from sections import attach_sections, CHUNK_WORDS, MAX_CHUNKS
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+LINE_HEIGHT = 14
+
+# Base-14 font pairs (regular, bold); PyMuPDF embeds nothing for these
+FONT_MIXES = {
+    "helv": [("helv", "hebo")],
+    "mixed": [("helv", "hebo"), ("tiro", "tibo"), ("cour", "cobo")],
+}
+
+VOCABULARY = {
+    "en": "the travel guide city coast river market museum garden evening morning local food wine bread "
+          "history culture festival harbour village church castle beach mountain road journey family friends "
+          "hotel restaurant breakfast season summer winter light stone old new small great",
+    "fr": "le la les ville côte rivière marché musée jardin soirée matin cuisine vin pain histoire culture "
+          "fête port village église château plage montagne route voyage famille amis hôtel été hiver "
+          "lumière pierre ancien nouveau petit grand très déjà où",
+    "de": "die der das stadt küste fluss markt museum garten abend morgen essen wein brot geschichte kultur "
+          "fest hafen dorf kirche burg strand berg straße reise familie freunde hotel sommer winter licht "
+          "stein alt neu klein groß schön über für",
+    "es": "el la los ciudad costa río mercado museo jardín tarde mañana comida vino pan historia cultura "
+          "fiesta puerto pueblo iglesia castillo playa montaña camino viaje familia amigos hotel verano "
+          "invierno luz piedra antiguo nuevo pequeño gran año niño",
+}
+
+PERSONA = "Travel Planner. Plan a trip of 4 days for a group of 10 college friends."
+
+def _sentence(rng, words, n):
+    return " ".join(rng.choice(words) for _ in range(n))
+
+def make_pdf(path, pages, headings_per_page=3, font_mix="helv", language="en", seed=0):
+    """
+    Write a synthetic PDF of body lines with headings_per_page headings per
+    page on average. Returns the number of headings written.
+    """
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    words = VOCABULARY[language].split()
+    fonts = FONT_MIXES[font_mix]
+    slots = int((PAGE_HEIGHT * 0.9 - 72) // LINE_HEIGHT)
+    heading_probability = min(1.0, headings_per_page / slots)
+    headings = 0
+
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        regular, bold = rng.choice(fonts)
+        y = 72
+        while y < PAGE_HEIGHT * 0.9:
+            if rng.random() < heading_probability:
+                size = rng.choice((14, 16, 18))
+                y += size * 0.6
+                page.insert_text((56, y), _sentence(rng, words, rng.randint(2, 6)).title(),
+                                 fontname=bold, fontsize=size)
+                y += size + 4
+                headings += 1
+            else:
+                page.insert_text((56, y), _sentence(rng, words, rng.randint(8, 13)).capitalize() + ".",
+                                 fontname=regular, fontsize=10)
+                y += LINE_HEIGHT
+    doc.save(path)
+    doc.close()
+    return headings
+
+def generate_corpus(out_dir, documents, pages, headings_per_page=3, font_mix="helv", language="en", seed=0):
+    """Generate documents PDFs of pages pages each; returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(out_dir, f"synthetic_{pages:04d}p_{i:02d}.pdf")
+        make_pdf(path, pages, headings_per_page, font_mix, language, seed=seed * 1000 + i)
+        paths.append(path)
+    return paths
+
+def latency_summary(latencies, units=None):
+    """Percentiles (ms) of per-call latencies; throughput per second for each unit count given."""
+    values = np.asarray(latencies) * 1000
+    summary = {
+        "calls": len(values),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+    total = sum(latencies)
+    for name, count in (units or {}).items():
+        summary[f"{name}_per_s"] = round(count / total, 1) if total else None
+    return summary
+
+def timed(func, items, repeats):
+    """Call func(item) for each item, repeats times; returns (latencies, results of the last pass)."""
+    latencies = []
+    results = []
+    for _ in range(repeats):
+        results = []
+        for item in items:
+            start = time.perf_counter()
+            results.append(func(item))
+            latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+def peak_alloc_mb(func, items):
+    """tracemalloc peak (MB) of one pass of func over items; run separately so timings are not skewed."""
+    tracemalloc.start()
+    try:
+        for item in items:
+            func(item)
+        return round(tracemalloc.get_traced_memory()[1] / (1 << 20), 2)
+    finally:
+        tracemalloc.stop()
+
+def bench_stages(paths, repeats, embedder=None):
+    """Time each in-process stage over the corpus in paths."""
+    stages = {}
+    detector = HeadingDetector()
+
+    # extract_blocks: one call per document
+    latencies, extracted = timed(extract_blocks, paths, repeats)
+    pages = sum(page_count(path) for path in paths)
+    lines = sum(len(blocks) for blocks, _, _ in extracted)
+    stages["extract_blocks"] = dict(
+        latency_summary(latencies, {"pages": pages * repeats, "lines": lines * repeats}),
+        peak_alloc_mb=peak_alloc_mb(extract_blocks, paths),
+    )
+
+    # is_likely_heading: heuristic filter over each document's blocks
+    def heuristics(work):
+        blocks, body_font, body_color = work
+        return likely_heading_indices(blocks, body_font, body_color, 3, 100)
+    latencies, survivors = timed(heuristics, extracted, repeats)
+    candidates = sum(len(s) for s in survivors)
+    stages["is_likely_heading"] = dict(
+        latency_summary(latencies, {"lines": lines * repeats, "candidates": candidates * repeats}),
+        peak_alloc_mb=peak_alloc_mb(heuristics, extracted),
+    )
+
+    # HeadingDetector: batch classification of each document's survivors
+    work = [(blocks, bf, bc, idx, os.path.basename(path))
+            for (blocks, bf, bc), idx, path in zip(extracted, survivors, paths)]
+    def classify(item):
+        blocks, body_font, body_color, indices, name = item
+        return classify_headings(detector, blocks.take(indices), body_font, body_color, name,
+                                 indices=indices)
+    latencies, classified = timed(classify, work, repeats)
+    headings = sum(len(c) for c in classified)
+    stages["heading_detector"] = dict(
+        latency_summary(latencies, {"candidates": candidates * repeats, "headings": headings * repeats}),
+        peak_alloc_mb=peak_alloc_mb(classify, work),
+    )
+
+    if embedder is None:
+        return stages, {"pages": pages, "lines": lines, "candidates": candidates, "headings": headings}
+
+    from ranker import rank_section_chunks
+
+    sections = []
+    for (blocks, _, _), doc_candidates in zip(extracted, classified):
+        attach_sections(doc_candidates, blocks, CHUNK_WORDS, MAX_CHUNKS)
+        sections.extend(doc_candidates)
+    texts = [c for sec in sections for c in (sec.get("chunks") or [sec["text"]])]
+    persona = embedder.embed([PERSONA])[0]
+
+    # PersonaEmbedder.embed: one batched call over every section chunk
+    latencies, _ = timed(embedder.embed, [texts], repeats)
+    stages["embed"] = dict(
+        latency_summary(latencies, {"texts": len(texts) * repeats}),
+        peak_alloc_mb=peak_alloc_mb(embedder.embed, [texts]),
+    )
+
+    # rank_sections: chunk embedding + scoring + ordering of the whole corpus
+    def rank(items):
+        return rank_section_chunks(items, persona, embedder=embedder)
+    latencies, _ = timed(rank, [sections], repeats)
+    stages["rank_sections"] = dict(
+        latency_summary(latencies, {"sections": len(sections) * repeats}),
+        peak_alloc_mb=peak_alloc_mb(rank, [sections]),
+    )
+    return stages, {"pages": pages, "lines": lines, "candidates": candidates, "headings": headings,
+                    "chunks": len(texts)}
+
+def bench_pipeline(paths, repeats, extra_args=()):
+    """
+    Run outline_extractor.py in a scratch workspace whose input/ holds the
+    corpus; returns wall-time percentiles and the child's peak RSS.
+    """
+    workspace = tempfile.mkdtemp(prefix="bench-pipeline-")
+    try:
+        input_dir = os.path.join(workspace, "input")
+        os.makedirs(input_dir)
+        for path in paths:
+            os.symlink(os.path.abspath(path), os.path.join(input_dir, os.path.basename(path)))
+        with open(os.path.join(input_dir, "challenge.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "documents": [{"filename": os.path.basename(p)} for p in paths],
+                "persona": {"role": "Travel Planner"},
+                "job_to_be_done": {"task": "Plan a trip of 4 days for a group of 10 college friends."},
+            }, f)
+        os.symlink(os.path.join(REPO_DIR, "model"), os.path.join(workspace, "model"))
+
+        latencies = []
+        peak_rss = 0.0
+        command = [sys.executable, os.path.join(REPO_DIR, "outline_extractor.py"), *extra_args]
+        for _ in range(repeats):
+            start = time.perf_counter()
+            process = subprocess.Popen(command, cwd=workspace, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            stderr = process.stderr.read()
+            _, status, usage = os.wait4(process.pid, 0)
+            latencies.append(time.perf_counter() - start)
+            if status != 0:
+                raise RuntimeError(f"outline_extractor.py failed:\n{stderr.decode(errors='replace')[-2000:]}")
+            peak_rss = max(peak_rss, usage.ru_maxrss / 1024)  # KB on Linux
+        return dict(latency_summary(latencies), peak_rss_mb=round(peak_rss, 1))
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def compare(results, baseline, tolerance, min_delta_ms=1.0):
+    """
+    List (scale, stage, baseline p50, current p50) where p50 grew by more
+    than tolerance and by at least min_delta_ms, so sub-millisecond noise
+    is not reported.
+    """
+    old = {(s["pages"], name): stats for s in baseline["scales"] for name, stats in s["stages"].items()}
+    regressions = []
+    for scale in results["scales"]:
+        for name, stats in scale["stages"].items():
+            before = old.get((scale["pages"], name))
+            if (before and stats["p50_ms"] > before["p50_ms"] * (1 + tolerance)
+                    and stats["p50_ms"] - before["p50_ms"] >= min_delta_ms):
+                regressions.append((scale["pages"], name, before["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on a synthetic PDF corpus")
+    parser.add_argument("--scales", default="5,20,80", help="Comma-separated pages per document")
+    parser.add_argument("--documents", type=int, default=4, help="Documents per scale")
+    parser.add_argument("--headings-per-page", type=float, default=3)
+    parser.add_argument("--font-mix", choices=sorted(FONT_MIXES), default="mixed")
+    parser.add_argument("--language", choices=sorted(VOCABULARY), default="en")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5, help="Timed passes per stage")
+    parser.add_argument("--pipeline-repeats", type=int, default=3, help="Full pipeline runs per scale")
+    parser.add_argument("--skip-embed", action="store_true", help="Skip embed/rank stages (no ONNX model needed)")
+    parser.add_argument("--skip-pipeline", action="store_true", help="Skip full outline_extractor.py runs")
+    parser.add_argument("--corpus-dir", default=None, help="Keep the generated PDFs here (default: temporary)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="Earlier results to compare p50 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 growth before a regression is reported")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="Ignore p50 growth smaller than this, whatever its ratio")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    scales = [int(s) for s in args.scales.split(",")]
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="bench-corpus-")
+
+    embedder = None
+    if not args.skip_embed:
+        from persona_module import PersonaEmbedder
+        embedder = PersonaEmbedder()
+        embedder.warmup()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "corpus_dir")},
+        },
+        "scales": [],
+    }
+    try:
+        for pages in scales:
+            paths = generate_corpus(os.path.join(corpus_dir, f"{pages}p"), args.documents, pages,
+                                    args.headings_per_page, args.font_mix, args.language, args.seed)
+            print(f"📄 {args.documents} × {pages}-page documents")
+            stages, counts = bench_stages(paths, args.repeats, embedder)
+            if not args.skip_pipeline:
+                stages["pipeline"] = bench_pipeline(paths, args.pipeline_repeats)
+            results["scales"].append({"pages": pages, "documents": args.documents, "counts": counts, "stages": stages})
+            for name, stats in stages.items():
+                throughput = ", ".join(f"{k[:-6]} {v}/s" for k, v in stats.items() if k.endswith("_per_s"))
+                print(f"    {name:<18} p50 {stats['p50_ms']:>10.2f}ms  p95 {stats['p95_ms']:>10.2f}ms  {throughput}")
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for pages, name, before, after in regressions:
+            print(f"❌ {pages}-page {name}: p50 {before:.2f}ms → {after:.2f}ms")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No stage regressed by more than {args.tolerance:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
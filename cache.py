@@ -0,0 +1,270 @@
+import atexit
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from extract_candidates import BlockTable
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hex SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_json_atomic(path, data):
+    # Per-process temp name: concurrent writers never share a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store on disk.
+
+    Vectors live in a memory-mapped float32 matrix (vectors.f32) with a fixed
+    number of rows; index.json maps each key to its row, ordered from least to
+    most recently used. When the matrix is full the least recently used row is
+    reused. Keys combine the model file hash with the text hash, so switching
+    models never returns stale vectors.
+
+    keys.bin holds a digest of the key stored in each row and is written
+    together with the vector. Rows can be reused by another process (or
+    before index.json is saved), so get() checks the digest and treats a
+    mismatch as a miss.
+    """
+    INDEX_FILE = "index.json"
+    VECTORS_FILE = "vectors.f32"
+    KEYS_FILE = "keys.bin"
+    DIGEST_SIZE = 16
+
+    def __init__(self, cache_dir, max_entries=50000):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.index_path = os.path.join(cache_dir, self.INDEX_FILE)
+        self.vectors_path = os.path.join(cache_dir, self.VECTORS_FILE)
+        self.keys_path = os.path.join(cache_dir, self.KEYS_FILE)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.dim = None
+        self.entries = OrderedDict()  # key -> row, LRU first
+        self.model_hashes = {}        # model path -> [size, mtime_ns, sha256]
+        self._vectors = None
+        self._row_keys = None
+        self._dirty = False
+
+        if os.path.exists(self.index_path) and os.path.exists(self.vectors_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self.model_hashes = index.get("model_hashes", {})
+            # A different capacity means a different matrix shape: start over
+            if index.get("capacity") == max_entries:
+                self.dim = index["dim"]
+                self.entries = OrderedDict(index["entries"])
+        self._index_rows()
+
+        atexit.register(self.flush)
+
+    def model_key(self, model_path, *extra):
+        """
+        Key prefix for a model file. The file hash is remembered against its
+        size and mtime so an unchanged model is not re-hashed on every start.
+        """
+        path = os.path.abspath(model_path)
+        stat = os.stat(path)
+        known = self.model_hashes.get(path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            sha = known[2]
+        else:
+            sha = file_sha256(path)
+            self.model_hashes[path] = [stat.st_size, stat.st_mtime_ns, sha]
+            self._dirty = True
+        return ":".join((sha,) + tuple(str(e) for e in extra))
+
+    @staticmethod
+    def key(prefix, text):
+        return hashlib.sha256(f"{prefix}\0{text}".encode("utf-8")).hexdigest()
+
+    def _index_rows(self):
+        """Rows not referenced by the index, and the first row never used."""
+        used = set(self.entries.values())
+        self._next_row = max(used) + 1 if used else 0
+        self._free_rows = sorted(set(range(self._next_row)) - used, reverse=True)
+
+    @classmethod
+    def _digest(cls, key):
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=cls.DIGEST_SIZE).digest()
+
+    def _open_vectors(self, dim):
+        if self._vectors is not None:
+            return self._vectors
+        if self.dim is not None and self.dim != dim:
+            self.entries.clear()
+        # Caches written without keys.bin cannot be verified: start over
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.keys_path)):
+            self.entries.clear()
+        if not self.entries:
+            self._index_rows()
+        mode = "r+" if self.entries else "w+"
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode,
+                                  shape=(self.max_entries, dim))
+        self._row_keys = np.memmap(self.keys_path, dtype=np.uint8, mode=mode,
+                                   shape=(self.max_entries, self.DIGEST_SIZE))
+        self.dim = dim
+        return self._vectors
+
+    def get(self, key):
+        """Return a copy of the cached vector for key, or None."""
+        row = self.entries.get(key)
+        if row is None or self.dim is None:
+            return None
+        vectors = self._open_vectors(self.dim)
+        if key not in self.entries:
+            return None
+        if self._row_keys[row].tobytes() != self._digest(key):
+            # The row now holds another key's vector
+            del self.entries[key]
+            self._free_rows.append(row)
+            self._dirty = True
+            return None
+        self.entries.move_to_end(key)
+        self._dirty = True
+        return np.array(vectors[row])
+
+    def put_many(self, keys, vectors):
+        """Store one vector per key, evicting least recently used rows when full."""
+        if not len(keys):
+            return
+        matrix = self._open_vectors(vectors.shape[1])
+        for key, vector in zip(keys, vectors):
+            row = self.entries.get(key)
+            if row is None:
+                if self._free_rows:
+                    row = self._free_rows.pop()
+                elif self._next_row < self.max_entries:
+                    row = self._next_row
+                    self._next_row += 1
+                else:
+                    _, row = self.entries.popitem(last=False)
+            self.entries[key] = row
+            self.entries.move_to_end(key)
+            matrix[row] = vector
+            self._row_keys[row] = np.frombuffer(self._digest(key), dtype=np.uint8)
+        self._dirty = True
+
+    def flush(self):
+        """Persist vectors and the index (also run automatically at exit)."""
+        if not self._dirty:
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._row_keys.flush()
+        _write_json_atomic(self.index_path, {
+            "dim": self.dim,
+            "capacity": self.max_entries,
+            "model_hashes": self.model_hashes,
+            "entries": list(self.entries.items()),
+        })
+        self._dirty = False
+
+# Bumped whenever extract_blocks output changes for the same PDF (2: running headers/footers dropped,
+# 3: multi-line headers/footers)
+EXTRACTION_VERSION = 3
+
+class ExtractionCache:
+    """
+    Per-document cache of extract_blocks output.
+
+    Each PDF gets one compressed .npz file holding its BlockTable column by
+    column (texts as one UTF-8 buffer plus offsets) together with the body
+    font/color and the source file's size, mtime and SHA-256. A matching
+    size+mtime is trusted directly; otherwise the content hash decides, so a
+    touched-but-unchanged file is not re-parsed. Entries written by another
+    EXTRACTION_VERSION are treated as stale. Output extracted with
+    drop_repeated=False (running headers/footers kept) is stored separately.
+    """
+
+    def __init__(self, cache_dir, drop_repeated=True):
+        self.cache_dir = cache_dir
+        self.drop_repeated = drop_repeated
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, pdf_path):
+        name = hashlib.sha1(os.path.abspath(pdf_path).encode("utf-8")).hexdigest()
+        suffix = "" if self.drop_repeated else "-keep-repeated"
+        return os.path.join(self.cache_dir, f"{name}{suffix}.npz")
+
+    def load(self, pdf_path):
+        """Return (blocks, body_font, body_color) if the cached entry is current, else None."""
+        entry_path = self._entry_path(pdf_path)
+        if not os.path.exists(entry_path):
+            return None
+
+        stat = os.stat(pdf_path)
+        with np.load(entry_path) as data:
+            columns = {name: data[name] for name in data.files}
+
+        if "version" not in columns or int(columns["version"]) != EXTRACTION_VERSION:
+            return None
+        if int(columns["size"]) != stat.st_size:
+            return None
+        if int(columns["mtime_ns"]) != stat.st_mtime_ns:
+            sha = file_sha256(pdf_path)
+            if str(columns["sha256"]) != sha:
+                return None
+            # Same content under a new mtime: refresh the entry's stat
+            columns["mtime_ns"] = np.int64(stat.st_mtime_ns)
+            self._write(entry_path, columns)
+
+        body_font = float(columns["body_font"])
+        body_font = None if np.isnan(body_font) else body_font
+        return self._decode_blocks(columns), body_font, int(columns["body_color"])
+
+    def store(self, pdf_path, blocks, body_font, body_color):
+        stat = os.stat(pdf_path)
+        columns = self._encode_blocks(blocks)
+        columns.update(
+            version=np.int64(EXTRACTION_VERSION),
+            size=np.int64(stat.st_size),
+            mtime_ns=np.int64(stat.st_mtime_ns),
+            sha256=np.array(file_sha256(pdf_path)),
+            body_font=np.float64(np.nan if body_font is None else body_font),
+            body_color=np.int64(body_color),
+        )
+        self._write(self._entry_path(pdf_path), columns)
+
+    def get_or_extract(self, pdf_path, extract):
+        """Return cached blocks for pdf_path, calling extract(pdf_path) only when stale."""
+        cached = self.load(pdf_path)
+        if cached is not None:
+            return cached
+        result = extract(pdf_path)
+        self.store(pdf_path, *result)
+        return result
+
+    @staticmethod
+    def _write(entry_path, columns):
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmp_path, entry_path)
+
+    @staticmethod
+    def _encode_blocks(blocks):
+        columns = {name: getattr(blocks, name) for name, _ in BlockTable.COLUMNS}
+        encoded = [text.encode("utf-8") for text in blocks.text]
+        columns["text_offsets"] = np.cumsum([0] + [len(e) for e in encoded], dtype=np.int64)
+        columns["text_data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return columns
+
+    @staticmethod
+    def _decode_blocks(columns):
+        data = columns["text_data"].tobytes()
+        offsets = columns["text_offsets"].tolist()
+        texts = [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+        return BlockTable(texts, *(columns[name] for name, _ in BlockTable.COLUMNS))
@@ -0,0 +1,84 @@
+"""
+Export the pickled heading classifier (StandardScaler + LogisticRegression)
+to model/heading_model.npz, which utils.HeadingDetector scores with NumPy
+alone. scikit-learn and joblib are only needed to run this converter.
+
+The converted model is checked against the pickle on a reference set (the
+features of every block in the input PDFs plus random rows spread around
+the training distribution); predict and predict_proba must match exactly,
+otherwise nothing is written.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from extract_candidates import extract_blocks
+from utils import ARRAY_MODEL_PATH, PICKLED_MODEL_PATH, FEATURE_NAMES, HeadingDetector, LinearHeadingModel
+
+def reference_features(input_dir, random_rows, seed=0):
+    """Feature rows of all blocks in input_dir's PDFs plus random_rows synthetic rows."""
+    documents = [np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)]
+    for fname in sorted(os.listdir(input_dir)):
+        if not fname.lower().endswith(".pdf"):
+            continue
+        blocks, body_font, body_color = extract_blocks(os.path.join(input_dir, fname))
+        if len(blocks):
+            documents.append(HeadingDetector.build_features(blocks, body_font, body_color))
+    X = np.concatenate(documents)
+
+    rng = np.random.default_rng(seed)
+    synthetic = np.empty((random_rows, len(FEATURE_NAMES)), dtype=np.float32)
+    synthetic[:, 0] = rng.uniform(4, 40, random_rows)
+    synthetic[:, 1] = rng.integers(0, 2, random_rows)
+    synthetic[:, 2] = rng.integers(0, 600, random_rows)
+    synthetic[:, 3] = rng.integers(0, 850, random_rows)
+    synthetic[:, 4] = rng.integers(1, 200, random_rows)
+    synthetic[:, 5] = rng.uniform(6, 16, random_rows)
+    synthetic[:, 6] = synthetic[:, 0] / synthetic[:, 5]
+    return np.concatenate((X, synthetic))
+
+def verify(scaler, model, converted, X):
+    """Return (predictions equal, probabilities equal, max probability difference) on X."""
+    scaled = scaler.transform(X)
+    expected_labels = model.predict(scaled)
+    expected_proba = model.predict_proba(scaled)
+    labels = converted.predict(X)
+    proba = converted.predict_proba(X)
+    return (
+        np.array_equal(expected_labels, labels),
+        np.array_equal(expected_proba, proba),
+        float(np.abs(expected_proba - proba).max()) if len(X) else 0.0,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the pickled heading model to NumPy arrays")
+    parser.add_argument("--pickle", default=PICKLED_MODEL_PATH)
+    parser.add_argument("--out", default=ARRAY_MODEL_PATH)
+    parser.add_argument("--input-dir", default="input", help="PDFs whose blocks form the reference set")
+    parser.add_argument("--random-rows", type=int, default=100000, help="Synthetic reference rows")
+    args = parser.parse_args()
+
+    import joblib
+
+    scaler, model = joblib.load(args.pickle)
+    converted = LinearHeadingModel.from_sklearn(scaler, model)
+
+    X = reference_features(args.input_dir, args.random_rows)
+    labels_ok, proba_ok, max_diff = verify(scaler, model, converted, X)
+    positives = int((converted.predict(X) == 1).sum())
+    print(f"🔍 Reference set: {len(X)} rows ({positives} headings); "
+          f"predict {'matches' if labels_ok else 'DIFFERS'}, predict_proba "
+          f"{'matches' if proba_ok else 'DIFFERS'} (max diff {max_diff:.3g})")
+    if not (labels_ok and proba_ok):
+        print("❌ Converted model does not match the pickle exactly; nothing written")
+        sys.exit(1)
+
+    tmp_path = f"{args.out}.tmp.npz"
+    converted.save(tmp_path)
+    os.replace(tmp_path, args.out)
+    print(f"✅ Saved {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Duplicate handling between candidate collection and ranking.
+
+Generic titles ("Introduction", "Conclusion", ...) and boilerplate chunks
+recur across a collection. embed_unique groups texts by a normalized key,
+embeds each distinct text once and scatters the vectors back to every
+occurrence. With a PersonaEmbedder the key is the tokenizer's own
+normalization (lowercasing, accent stripping, whitespace cleanup), so
+texts sharing a key produce the same token ids and rankings are unchanged.
+
+collapse_boilerplate optionally drops headings that repeat on many pages of
+one document (running banners that slip through the 5%/95% header/footer
+cut). Headings are compared like header/footer lines: only page numbering
+is folded (see extract_candidates.page_furniture_key), so numbered
+headings such as "Day 1" ... "Day 10" are all kept.
+"""
+import numpy as np
+
+from extract_candidates import page_furniture_key
+
+def default_key(text):
+    """Case- and whitespace-insensitive key for embedders without their own normalizer."""
+    return " ".join(text.lower().split())
+
+def unique_texts(texts, key=default_key):
+    """
+    Distinct texts by key, in first-occurrence order, plus the index of
+    every input text's representative: texts[i] maps to unique[inverse[i]].
+    """
+    positions = {}
+    unique = []
+    inverse = np.empty(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        k = key(text)
+        position = positions.get(k)
+        if position is None:
+            position = positions[k] = len(unique)
+            unique.append(text)
+        inverse[i] = position
+    return unique, inverse
+
+def embed_unique(embedder, texts, **kwargs):
+    """
+    embedder.embed(texts, **kwargs) with every distinct text embedded once.
+    Returns (unique embeddings, inverse); unique embeddings[inverse] has one
+    row per input text, so callers can score the unique rows and scatter
+    the scores instead.
+    """
+    unique, inverse = unique_texts(texts, key=getattr(embedder, "text_key", default_key))
+    return embedder.embed(unique, **kwargs), inverse
+
+def boilerplate_key(text, page):
+    """Key of a heading on a given page with only its page numbering folded."""
+    return page_furniture_key(text, page)
+
+def collapse_boilerplate(candidates, min_pages):
+    """
+    Drop every candidate of one document whose boilerplate_key appears on at
+    least min_pages distinct pages, except its first occurrence. Candidates
+    must be in reading order; the kept ones stay in order.
+    """
+    pages = {}
+    for c in candidates:
+        pages.setdefault(boilerplate_key(c["text"], c["page"]), set()).add(c["page"])
+    repeated = {k for k, seen in pages.items() if len(seen) >= min_pages}
+    if not repeated:
+        return candidates
+
+    kept = []
+    seen = set()
+    for c in candidates:
+        k = boilerplate_key(c["text"], c["page"])
+        if k in repeated:
+            if k in seen:
+                continue
+            seen.add(k)
+        kept.append(c)
+    return kept
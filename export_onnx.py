@@ -1,33 +1,128 @@
-from transformers import AutoTokenizer, AutoModel
-import torch
+import argparse
 import os
 
-# Define model name and export path
+import numpy as np
+
+# Define model name and export paths
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 EXPORT_PATH = "model/all-MiniLM-L6-v2.onnx"
+OPTIMIZED_PATH = "model/all-MiniLM-L6-v2.opt.onnx"
+QUANTIZED_PATH = "model/all-MiniLM-L6-v2.int8.onnx"
+
+# Sample texts for the fp32 vs. variant parity check
+PARITY_TEXTS = [
+    "Introduction",
+    "Travel Tips",
+    "Conclusion",
+    "Nightlife and Entertainment",
+    "Comprehensive Guide to Major Cities in the South of France",
+    "Coastal Adventures: beaches, boat tours and water sports along the Riviera",
+    "Packing tips for a group trip with ten college friends",
+    "Travel Planner. Plan a trip of 4 days for a group of 10 college friends.",
+    "Graph neural networks for drug discovery",
+    "Méthodologie et résultats expérimentaux",
+]
+
+def export_fp32(export_path=EXPORT_PATH):
+    """
+    Export MiniLM with sentence-transformers pooling baked into the graph:
+    attention-masked mean over last_hidden_state, then L2 normalization.
+    The single output, sentence_embedding, is ready for dot-product ranking.
+    """
+    from transformers import AutoTokenizer, AutoModel
+    import torch
+
+    class MeanPooledEncoder(torch.nn.Module):
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_ids, attention_mask):
+            hidden = self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+            mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            return torch.nn.functional.normalize(pooled, p=2, dim=1)
+
+    # Load model and tokenizer from HuggingFace
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = MeanPooledEncoder(AutoModel.from_pretrained(MODEL_NAME))
+    model.eval()
+
+    # Dummy input (for tracing)
+    inputs = tokenizer(["This is a sample input."], return_tensors="pt")
+
+    # Export model to ONNX
+    torch.onnx.export(
+        model,
+        args=(inputs["input_ids"], inputs["attention_mask"]),
+        f=export_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["sentence_embedding"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "sentence_embedding": {0: "batch"},
+        },
+        opset_version=14,
+    )
+    print(f"✅ Exported ONNX model to {export_path}")
+
+def optimize(source_path=EXPORT_PATH, optimized_path=OPTIMIZED_PATH):
+    """
+    Save the graph after onnxruntime's offline optimizations (constant folding,
+    node fusions). ORT_ENABLE_EXTENDED keeps the file portable across CPUs;
+    layout-specific ORT_ENABLE_ALL rewrites are left to session creation.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = optimized_path
+    ort.InferenceSession(source_path, sess_options=options, providers=["CPUExecutionProvider"])
+    print(f"✅ Saved optimized graph to {optimized_path}")
+
+def quantize(source_path=EXPORT_PATH, quantized_path=QUANTIZED_PATH):
+    """Dynamic INT8 quantization of the weights; activations are quantized at run time."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(source_path, quantized_path, weight_type=QuantType.QInt8)
+    print(f"✅ Saved INT8 model to {quantized_path}")
+
+def parity_check(reference_path, candidate_path, texts=PARITY_TEXTS, min_cosine=0.98):
+    """
+    Embed texts with both models and compare row-wise cosine similarity.
+    Returns the per-text cosines; raises if any falls below min_cosine.
+    """
+    from persona_module import PersonaEmbedder
+
+    reference = PersonaEmbedder(model_path=reference_path).embed(texts)
+    candidate = PersonaEmbedder(model_path=candidate_path).embed(texts)
+    # Both embeddings are L2-normalized, so the row-wise dot product is the cosine
+    cosines = np.sum(reference * candidate, axis=1)
+    name = os.path.basename(candidate_path)
+    print(f"🔍 {name}: cosine vs fp32 min {cosines.min():.4f}, mean {cosines.mean():.4f}")
+    if cosines.min() < min_cosine:
+        raise RuntimeError(f"{name} failed parity check: min cosine {cosines.min():.4f} < {min_cosine}")
+    return cosines
+
+def main():
+    parser = argparse.ArgumentParser(description="Export MiniLM to ONNX plus optimized and INT8 variants")
+    parser.add_argument("--skip-export", action="store_true",
+                        help="Reuse the existing fp32 model instead of exporting from HuggingFace")
+    parser.add_argument("--min-cosine", type=float, default=0.98,
+                        help="Minimum per-text cosine against fp32 for the parity check")
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        export_fp32(EXPORT_PATH)
+    optimize(EXPORT_PATH, OPTIMIZED_PATH)
+    quantize(EXPORT_PATH, QUANTIZED_PATH)
+
+    for path in (OPTIMIZED_PATH, QUANTIZED_PATH):
+        parity_check(EXPORT_PATH, path, min_cosine=args.min_cosine)
+
+    for path in (EXPORT_PATH, OPTIMIZED_PATH, QUANTIZED_PATH):
+        print(f"📦 {os.path.basename(path)}: {os.path.getsize(path) / 2**20:.1f} MB")
 
-# Load model and tokenizer from HuggingFace
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModel.from_pretrained(MODEL_NAME)
-model.eval()
-
-# Dummy input (for tracing)
-inputs = tokenizer(["This is a sample input."], return_tensors="pt")
-
-# Export model to ONNX
-torch.onnx.export(
-    model,
-    args=(inputs["input_ids"], inputs["attention_mask"]),
-    f=EXPORT_PATH,
-    input_names=["input_ids", "attention_mask"],
-    output_names=["last_hidden_state", "pooler_output"],
-    dynamic_axes={
-        "input_ids": {0: "batch", 1: "sequence"},
-        "attention_mask": {0: "batch", 1: "sequence"},
-        "last_hidden_state": {0: "batch", 1: "sequence"},
-        "pooler_output": {0: "batch"},
-    },
-    opset_version=14,
-)
-
-print(f"✅ Exported ONNX model to {EXPORT_PATH}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
-import fitz  # PyMuPDF
+import argparse
 import csv
+import math
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from collections import Counter
 import json
 
+import numpy as np
+
+from profiling import PROFILER
+
 INPUT_DIR = "dataset"
 OUTPUT_CSV = "candidates.csv"
 
@@ -29,45 +35,78 @@ def has_excessive_whitespace(text: str, threshold: float = 0.30) -> bool:
     
     return whitespace_ratio > threshold
 
+# Enhanced pattern detection for mathematical expressions
+MATH_PATTERNS = [
+    r'[a-zA-Z]\s*[=<>≤≥]\s*[a-zA-Z\d]',  # Variable assignments like x = y
+    r'\{[^}]*\}',  # Set notation
+    r'\|[^|]*\|',  # Absolute value or cardinality
+    r'[a-zA-Z]\s*⊆\s*[a-zA-Z]',  # Subset notation
+    r'[a-zA-Z]\s*×\s*[a-zA-Z]',  # Cross product
+    r'∀\s*[a-zA-Z]',  # Universal quantifier
+    r'∃\s*[a-zA-Z]',  # Existential quantifier
+    r'[a-zA-Z]\s*\(\s*[a-zA-Z]\s*\)',  # Function notation
+    r'\|\s*[a-zA-Z]\s*\|',  # Norm notation
+    r'[a-zA-Z]_\{[^}]+\}',  # Subscript with braces
+    r'[a-zA-Z]\^[{\d]',  # Superscript
+    r'V\s*=\s*\{.*\}',  # Set definitions like V = {v1, ..., vN}
+    r'∥.*∥\s*[≤≥]\s*.*∥.*∥',  # Norm inequalities
+]
+MATH_PATTERN_RES = [re.compile(pattern) for pattern in MATH_PATTERNS]
+# One alternation to rule out all patterns in a single search
+MATH_ANY_RE = re.compile("|".join(f"(?:{pattern})" for pattern in MATH_PATTERNS))
+
+# Skip common non-heading patterns
+SKIP_PATTERNS = [
+    r'^\d+\s*$',  # Just numbers
+    r'^[a-zA-Z]\s*[=<>≤≥]\s*',  # Mathematical equations
+    r'^\([^)]+\)\s*$',  # Just parentheses content
+    r'^Table\s+\d+',  # Table captions
+    r'^Figure\s+\d+',  # Figure captions
+    r'^Equation\s+\d+',  # Equation labels
+    r'^Fig\.\s*\d+',  # Figure abbreviations
+    r'^Tab\.\s*\d+',  # Table abbreviations
+]
+SKIP_RE = re.compile("|".join(f"(?:{pattern})" for pattern in SKIP_PATTERNS), re.IGNORECASE)
+
+def count_math_patterns(text: str) -> int:
+    """Number of distinct MATH_PATTERNS found in text."""
+    if MATH_ANY_RE.search(text) is None:
+        return 0
+    return sum(1 for pattern in MATH_PATTERN_RES if pattern.search(text))
+
 def contains_mathematical_symbols(text: str, threshold: float = 0.15) -> bool:
     """Enhanced detection of mathematical content"""
     # Count mathematical symbols
     math_count = sum(1 for char in text if char in MATH_SYMBOLS)
-    
-    # Enhanced pattern detection for mathematical expressions
-    math_patterns = [
-        r'[a-zA-Z]\s*[=<>≤≥]\s*[a-zA-Z\d]',  # Variable assignments like x = y
-        r'\{[^}]*\}',  # Set notation
-        r'\|[^|]*\|',  # Absolute value or cardinality
-        r'[a-zA-Z]\s*⊆\s*[a-zA-Z]',  # Subset notation
-        r'[a-zA-Z]\s*×\s*[a-zA-Z]',  # Cross product
-        r'∀\s*[a-zA-Z]',  # Universal quantifier
-        r'∃\s*[a-zA-Z]',  # Existential quantifier
-        r'[a-zA-Z]\s*\(\s*[a-zA-Z]\s*\)',  # Function notation
-        r'\|\s*[a-zA-Z]\s*\|',  # Norm notation
-        r'[a-zA-Z]_\{[^}]+\}',  # Subscript with braces
-        r'[a-zA-Z]\^[{\d]',  # Superscript
-        r'V\s*=\s*\{.*\}',  # Set definitions like V = {v1, ..., vN}
-        r'∥.*∥\s*[≤≥]\s*.*∥.*∥',  # Norm inequalities
-    ]
-    
-    pattern_matches = sum(1 for pattern in math_patterns 
-                         if re.search(pattern, text))
-    
+
     # Threshold for mathematical content
     total_chars = len(text.replace(' ', ''))
     if total_chars == 0:
         return False
-    
-    math_density = (math_count + pattern_matches * 2) / total_chars
+
+    math_density = (math_count + count_math_patterns(text) * 2) / total_chars
     return math_density > threshold
 
-def normalize_text(text: str) -> str:
+# Precompiled patterns for the extraction hot loop
+BOLD_FONT_RE = re.compile(r"bold|black", re.IGNORECASE)
+NO_SPACE_BEFORE_RE = re.compile(r"[,\.\)\]]")
+SINGLE_CHAR_TOKEN_RE = re.compile(r"(?:^|\s)\S\s")
+
+def open_pdf(pdf_path):
     """
-    Merge stray single-letter tokens into their following token,
-    e.g. ["I","NTRODUCTION"] -> ["INTRODUCTION"].
+    fitz.open with PyMuPDF imported on first use, so modules that only need
+    BlockTable or the text helpers (cache, ranking, the service front end) start
+    without it.
     """
-    tokens = text.split()
+    import fitz  # PyMuPDF
+    return fitz.open(pdf_path)
+
+def text_flags():
+    """get_text("dict") flags without image extraction: image blocks are skipped anyway."""
+    import fitz  # PyMuPDF
+    return fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+def _merge_stray_capitals(tokens) -> str:
     merged = []
     i = 0
     while i < len(tokens):
@@ -82,119 +121,567 @@ def normalize_text(text: str) -> str:
         i += 1
     return " ".join(merged)
 
-def extract_blocks(pdf_path):
-    """Extract merged text blocks from a PDF, preserving font info."""
-    doc = fitz.open(pdf_path)
-    raw = []
-    font_sizes = []
-    text_colors = []  # Track text colors
+def normalize_text(text: str) -> str:
+    """
+    Merge stray single-letter tokens into their following token,
+    e.g. ["I","NTRODUCTION"] -> ["INTRODUCTION"].
+    """
+    # Without a single-character token there is nothing to merge
+    if SINGLE_CHAR_TOKEN_RE.search(text) is None:
+        return " ".join(text.split())
+    return _merge_stray_capitals(text.split())
+
+class BlockTable:
+    """
+    Text lines of a PDF in reading order, stored column by column: one NumPy
+    array per layout feature plus a plain list of texts. Body style, heading
+    filters and classifier features are computed over whole columns instead
+    of one Python object per line.
+    """
+    # Numeric columns in constructor order (after text); char_length is derived from text
+    COLUMNS = (
+        ("page", np.int32),
+        ("font_size", np.float64),
+        ("is_bold", np.int8),
+        ("text_color", np.int64),
+        ("x", np.int32),
+        ("y", np.int32),
+        ("char_length", np.int32),
+    )
+    __slots__ = ("text",) + tuple(name for name, _ in COLUMNS)
+
+    def __init__(self, text, page, font_size, is_bold, text_color, x, y, char_length=None):
+        self.text = text
+        self.page = np.asarray(page, dtype=np.int32)
+        self.font_size = np.asarray(font_size, dtype=np.float64)
+        self.is_bold = np.asarray(is_bold, dtype=np.int8)
+        self.text_color = np.asarray(text_color, dtype=np.int64)
+        self.x = np.asarray(x, dtype=np.int32)
+        self.y = np.asarray(y, dtype=np.int32)
+        if char_length is None:
+            char_length = [len(t) for t in text]
+        self.char_length = np.asarray(char_length, dtype=np.int32)
 
-    for page in doc:
-        page_height = page.rect.height
-        
-        for b in page.get_text("dict")["blocks"]:
-            if b["type"] != 0:
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [], [], [], [])
+
+    @classmethod
+    def concatenate(cls, tables):
+        """One table holding the rows of tables, in order."""
+        tables = list(tables)
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+        texts = []
+        for table in tables:
+            texts.extend(table.text)
+        return cls(texts, *(np.concatenate([getattr(t, name) for t in tables]) for name, _ in cls.COLUMNS))
+
+    def __len__(self):
+        return len(self.text)
+
+    def take(self, indices):
+        """Sub-table of the rows at indices (in the given order)."""
+        indices = np.asarray(indices, dtype=np.int64)
+        text = self.text
+        return BlockTable([text[i] for i in indices.tolist()],
+                          *(getattr(self, name)[indices] for name, _ in self.COLUMNS))
+
+    def rows(self):
+        """Iterate (text, page, font_size, is_bold, text_color, x, y, char_length) tuples of Python scalars."""
+        return zip(self.text, *(getattr(self, name).tolist() for name, _ in self.COLUMNS))
+
+    def body_style(self):
+        """(body_font, body_color): the most common font size and text color, None/0 when empty."""
+        return most_common_value(self.font_size), most_common_value(self.text_color, default=0)
+
+def most_common_value(values, default=None):
+    """
+    Most frequent entry of a 1-D array as a Python scalar. Ties go to the
+    value that occurs first, as with Counter(values).most_common(1).
+    """
+    if not len(values):
+        return default
+    uniques, first, counts = np.unique(values, return_index=True, return_counts=True)
+    tied = np.flatnonzero(counts == counts.max())
+    return uniques[tied[np.argmin(first[tied])]].item()
+
+def _span_x(span):
+    return span["origin"][0]
+
+def merge_spans(spans, no_space_before=NO_SPACE_BEFORE_RE.match):
+    """Text of one line from its x-sorted spans, normalized; None if the line is blank."""
+    parts = []
+    for sp in spans:
+        chunk = sp["text"].strip()
+        if not chunk:
+            continue
+        if parts and not no_space_before(chunk):
+            parts.append(" ")
+        parts.append(chunk)
+    if not parts:
+        return None
+    return normalize_text("".join(parts))
+
+def page_blocks(page_dict, page_number, page_height, bold_fonts, line_filter=None):
+    """
+    Turn one page's get_text("dict") output into a BlockTable, one row per
+    text line. bold_fonts memoizes font name -> is_bold across the pages of
+    a document. line_filter(font_size, is_bold, text_color), if given, drops
+    lines before their text is merged.
+    """
+    top, bottom = page_height * 0.05, page_height * 0.95
+    texts, font_sizes, bolds, colors, xs, ys = [], [], [], [], [], []
+
+    for b in page_dict["blocks"]:
+        if b["type"] != 0:
+            continue
+        for line in b["lines"]:
+            spans = line["spans"]
+            if not spans:
                 continue
-            for line in b["lines"]:
-                spans = sorted(line["spans"], key=lambda s: s["origin"][0])
-                if not spans:
-                    continue
-
-                first = spans[0]
-                fs = first["size"]
-                fname = first["font"]
-                text_color = first.get("color", 0)  # Get text color (0 is typically black)
-                is_bold = bool(re.search(r"bold|black", fname, re.IGNORECASE))
-                x0, y0 = first["origin"]
-
-                # Skip likely headers/footers based on position
-                if y0 < (page_height * 0.05) or y0 > (page_height * 0.95):
-                    continue
-
-                # merge spans
-                text = ""
-                for sp in spans:
-                    chunk = sp["text"].strip()
-                    if not chunk:
-                        continue
-                    if text and not re.match(r"[,\.\)\]]", chunk):
-                        text += " "
-                    text += chunk
-                text = text.strip()
-                if not text:
-                    continue
-
-                text = normalize_text(text)
-
-                raw.append({
-                    "text": text,
-                    "page": page.number + 1,
-                    "font_size": fs,
-                    "is_bold": int(is_bold),
-                    "text_color": text_color,
-                    "x": int(x0),
-                    "y": int(y0),
-                    "char_length": len(text),
-                })
-                font_sizes.append(fs)
-                text_colors.append(text_color)
-
-    doc.close()
-    body_font = Counter(font_sizes).most_common(1)[0][0] if font_sizes else None
-    # Determine the most common text color (body text color)
-    body_color = Counter(text_colors).most_common(1)[0][0] if text_colors else 0
-    
-    return raw, body_font, body_color
+            if len(spans) > 1:
+                spans = sorted(spans, key=_span_x)
 
-def is_likely_heading(text: str, font_size: float, is_bold: bool, text_color: int, body_font: float, body_color: int) -> bool:
-    """Comprehensive heading detection with improved filtering"""
-    # Check for excessive whitespace (>30%)
-    if has_excessive_whitespace(text):
-        return False
-    
-    # Check for mathematical content
-    if contains_mathematical_symbols(text):
-        return False
-    
-    # Check if mostly symbols or special characters
-    alpha_chars = sum(1 for char in text if char.isalnum())
-    if len(text.replace(' ', '')) > 0 and alpha_chars / len(text.replace(' ', '')) < 0.5:
-        return False
-    
-    # Skip common non-heading patterns
-    skip_patterns = [
-        r'^\d+\s*$',  # Just numbers
-        r'^[a-zA-Z]\s*[=<>≤≥]\s*',  # Mathematical equations
-        r'^\([^)]+\)\s*$',  # Just parentheses content
-        r'^Table\s+\d+',  # Table captions
-        r'^Figure\s+\d+',  # Figure captions
-        r'^Equation\s+\d+',  # Equation labels
-        r'^Fig\.\s*\d+',  # Figure abbreviations
-        r'^Tab\.\s*\d+',  # Table abbreviations
-    ]
-    
-    if any(re.match(pattern, text, re.IGNORECASE) for pattern in skip_patterns):
-        return False
-    
-    # Font-based criteria with tolerance
+            first = spans[0]
+            x0, y0 = first["origin"]
+
+            # Skip likely headers/footers based on position
+            if y0 < top or y0 > bottom:
+                continue
+
+            fname = first["font"]
+            is_bold = bold_fonts.get(fname)
+            if is_bold is None:
+                is_bold = bold_fonts[fname] = int(BOLD_FONT_RE.search(fname) is not None)
+            text_color = first.get("color", 0)  # Get text color (0 is typically black)
+            if line_filter is not None and not line_filter(first["size"], is_bold, text_color):
+                continue
+
+            text = merge_spans(spans)
+            if text is None:
+                continue
+            texts.append(text)
+            font_sizes.append(first["size"])
+            bolds.append(is_bold)
+            colors.append(text_color)
+            xs.append(int(x0))
+            ys.append(int(y0))
+
+    pages = np.full(len(texts), page_number, dtype=np.int32)
+    return BlockTable(texts, pages, font_sizes, bolds, colors, xs, ys)
+
+def iter_page_blocks(pdf_path, line_filter=None, page_range=None):
+    """
+    Yield the BlockTable of each page as soon as that page is parsed.
+    page_range is an optional 0-based (start, stop) slice of pages.
+    """
+    bold_fonts = {}  # font name -> is_bold, memoized per document
+    flags = text_flags()
+    doc = open_pdf(pdf_path)
+    try:
+        start, stop = page_range or (0, doc.page_count)
+        for number in range(start, min(stop, doc.page_count)):
+            page = doc[number]
+            page_dict = page.get_text("dict", flags=flags)
+            yield page_blocks(page_dict, page.number + 1, page.rect.height, bold_fonts, line_filter)
+    finally:
+        doc.close()
+
+def page_style(page_dict, page_height, font_sizes, text_colors, edges=None, page_number=None):
+    """
+    Add each kept line's first-span size and color to the histograms without
+    merging text or building a BlockTable. Lines are kept by the same rules as
+    page_blocks, so full-scan histograms match BlockTable.body_style exactly.
+    With an edges list, (y, line_fingerprint) of the lines in the page's
+    outermost line positions (see edge_bounds; on 1-based page_number) are
+    appended to it; only those lines have their text merged.
+    Returns the number of kept lines.
+    """
+    top, bottom = page_height * 0.05, page_height * 0.95
+    lines = 0
+    kept = []
+    for b in page_dict["blocks"]:
+        if b["type"] != 0:
+            continue
+        for line in b["lines"]:
+            spans = line["spans"]
+            if not spans:
+                continue
+            first = min(spans, key=_span_x) if len(spans) > 1 else spans[0]
+            y0 = first["origin"][1]
+            if y0 < top or y0 > bottom:
+                continue
+            if not any(sp["text"] and not sp["text"].isspace() for sp in spans):
+                continue
+            font_sizes[first["size"]] += 1
+            text_colors[first.get("color", 0)] += 1
+            lines += 1
+            if edges is not None:
+                kept.append((int(y0), spans))
+
+    if kept:
+        page_top, page_bottom = edge_bounds([y for y, _ in kept])
+        for y, spans in kept:
+            if y <= page_top or y >= page_bottom:
+                edges.append((y, line_fingerprint(merge_spans(sorted(spans, key=_span_x)), y, page_number)))
+    return lines
+
+# Running headers/footers: a line fingerprint (page_furniture_key of the
+# text, y rounded to REPEATED_Y_TOLERANCE points) that is among the topmost or
+# bottom-most lines of at least REPEATED_MIN_PAGES pages and
+# REPEATED_PAGE_FRACTION of the pages with text. Detected lines are peeled
+# off and the edges recomputed, so a header or footer of several lines
+# ("- 3 -" above "Page 3 of 10") is removed whole; only the
+# REPEATED_EDGE_LINES outermost line positions of each page are looked at.
+REPEATED_MIN_PAGES = 3
+REPEATED_PAGE_FRACTION = 0.5
+REPEATED_EDGE_LINES = 3
+REPEATED_Y_TOLERANCE = 4
+
+# Header/footer lines are split into segments at |, · and • and at dashes
+# surrounded by spaces ("Annual Report — Page 3")
+PAGE_SEGMENT_SPLIT_RE = re.compile(r"\s*[|·•]\s*|\s+[-–—]\s+")
+# Page labels whose digits are folded: "page 3", "p. 3", "3 of 40", "3 / 40", "page 3 of 40"
+PAGE_LABEL_RE = re.compile(r"(?:(?:page|pg\.?|p\.)\s*\d+(?:\s*(?:of|/)\s*\d+)?|\d+\s*(?:of|/)\s*\d+)")
+# A bare page number, optionally decorated: "3", "- 3 -", "(3)", "[3]"
+BARE_NUMBER_RE = re.compile(r"[-–—(\[]?\s*(\d+)\s*[-–—)\]]?")
+PAGE_DIGITS_RE = re.compile(r"\d+")
+PUNCTUATION_RE = re.compile(r"[^\w#]+")
+
+def page_furniture_key(text, page):
+    """
+    Comparison key of a possible header/footer line on a given page.
+    Digits are only folded where they are page numbering: page labels
+    ("Page 3 of 40" -> "page # of #") and bare number segments, which keep
+    their offset from the physical page so only numbers that track the page
+    match. Everything else is compared exactly (case and punctuation aside),
+    so numbered headings like "Day 1" ... "Day 5" never match each other.
+    """
+    parts = []
+    for segment in PAGE_SEGMENT_SPLIT_RE.split(" ".join(text.lower().split())):
+        if PAGE_LABEL_RE.fullmatch(segment):
+            parts.append(PUNCTUATION_RE.sub(" ", PAGE_DIGITS_RE.sub("#", segment)).strip())
+            continue
+        number = BARE_NUMBER_RE.fullmatch(segment)
+        if number:
+            offset = int(number.group(1)) - page
+            parts.append(f"#{'m' if offset < 0 else 'p'}{abs(offset)}")
+            continue
+        segment = PUNCTUATION_RE.sub(" ", segment).strip()
+        if segment:
+            parts.append(segment)
+    return " | ".join(parts)
+
+def line_fingerprint(text, y, page):
+    """(page_furniture_key, y bucket) of a line, or None if it has no letters or digits (e.g. bullets)."""
+    key = page_furniture_key(text, page) if text else ""
+    if not key:
+        return None
+    return key, round(y / REPEATED_Y_TOLERANCE)
+
+def edge_bounds(ys):
+    """
+    (top, bottom) y limits of one page's outermost lines: lines with
+    y <= top or y >= bottom are within REPEATED_Y_TOLERANCE of one of the
+    page's REPEATED_EDGE_LINES highest or lowest distinct line positions.
+    """
+    levels = np.unique(ys)
+    k = min(REPEATED_EDGE_LINES, len(levels))
+    return levels[k - 1] + REPEATED_Y_TOLERANCE, levels[-k] - REPEATED_Y_TOLERANCE
+
+def repeated_fingerprints(page_edges, n_pages):
+    """
+    Running header/footer fingerprints, given each page's outermost lines as
+    (y, fingerprint) pairs (fingerprint None for lines without text). Each
+    round counts, per page, the fingerprints of the topmost and bottom-most
+    lines not yet found repeated; rounds stop when no new fingerprint
+    reaches the page threshold.
+    """
+    needed = max(REPEATED_MIN_PAGES, math.ceil(REPEATED_PAGE_FRACTION * n_pages))
+    repeated = set()
+    while True:
+        edge_pages = Counter()
+        for lines in page_edges:
+            rest = [(y, fingerprint) for y, fingerprint in lines if fingerprint not in repeated]
+            if not rest:
+                continue
+            top = min(y for y, _ in rest) + REPEATED_Y_TOLERANCE
+            bottom = max(y for y, _ in rest) - REPEATED_Y_TOLERANCE
+            edge_pages.update({fingerprint for y, fingerprint in rest
+                               if fingerprint is not None and (y <= top or y >= bottom)})
+        found = {fingerprint for fingerprint, pages in edge_pages.items() if pages >= needed}
+        if found <= repeated:
+            return repeated
+        repeated |= found
+
+def repeated_line_mask(blocks) -> np.ndarray:
+    """
+    Rows of one document's BlockTable that are running headers, footers or
+    page numbers: every line whose fingerprint is in repeated_fingerprints.
+    The outermost line positions of each page are found with column
+    operations; text is only fingerprinted for those lines and for lines in
+    a repeated y bucket.
+    """
+    mask = np.zeros(len(blocks), dtype=bool)
+    if not len(blocks):
+        return mask
+    page_numbers, page_index = np.unique(blocks.page, return_inverse=True)
+    if len(page_numbers) < REPEATED_MIN_PAGES:
+        return mask
+
+    # edge_bounds of every page at once: distinct (page, y) pairs sorted by page, then y
+    y = blocks.y
+    levels = np.unique(np.stack([page_index, y.astype(np.int64)]), axis=1)
+    starts = np.searchsorted(levels[0], np.arange(len(page_numbers)))
+    stops = np.append(starts[1:], levels.shape[1])
+    k = np.minimum(REPEATED_EDGE_LINES, stops - starts)
+    page_top = levels[1][starts + k - 1] + REPEATED_Y_TOLERANCE
+    page_bottom = levels[1][stops - k] - REPEATED_Y_TOLERANCE
+    edge = (y <= page_top[page_index]) | (y >= page_bottom[page_index])
+
+    texts = blocks.text
+    ys = y.tolist()
+    pages = page_index.tolist()
+    page_labels = blocks.page.tolist()
+    page_edges = [[] for _ in page_numbers]
+    for i in np.flatnonzero(edge).tolist():
+        page_edges[pages[i]].append((ys[i], line_fingerprint(texts[i], ys[i], page_labels[i])))
+
+    repeated = repeated_fingerprints(page_edges, len(page_numbers))
+    if not repeated:
+        return mask
+    buckets = np.array(sorted({bucket for _, bucket in repeated}))
+    for i in np.flatnonzero(np.isin(np.round(y / REPEATED_Y_TOLERANCE), buckets)).tolist():
+        mask[i] = line_fingerprint(texts[i], ys[i], page_labels[i]) in repeated
+    return mask
+
+def drop_repeated_lines(blocks):
+    """blocks without the rows flagged by repeated_line_mask."""
+    with PROFILER.stage("repeated_lines") as stage:
+        mask = repeated_line_mask(blocks)
+        stage.count(lines=len(blocks), dropped=int(mask.sum()))
+    return blocks.take(np.flatnonzero(~mask)) if mask.any() else blocks
+
+def scan_body_style(pdf_path, sample_pages=None):
+    """
+    First pass of two-pass extraction: return (body_font, body_color,
+    repeated) from span metadata, where repeated is the set of running
+    header/footer fingerprints (see repeated_line_mask; only the edge lines
+    of each page have their text merged). With sample_pages, only that many
+    evenly spaced pages are read, trading exactness for speed on very long
+    documents.
+    """
+    font_sizes = Counter()
+    text_colors = Counter()
+    page_edges = []
+    text_pages = 0
+    flags = text_flags()
+    doc = open_pdf(pdf_path)
+    try:
+        page_numbers = range(doc.page_count)
+        if sample_pages and sample_pages < doc.page_count:
+            page_numbers = np.unique(np.linspace(0, doc.page_count - 1, sample_pages).astype(int)).tolist()
+        for number in page_numbers:
+            page = doc[number]
+            edges = []
+            if page_style(page.get_text("dict", flags=flags), page.rect.height, font_sizes, text_colors,
+                          edges, page.number + 1):
+                text_pages += 1
+                page_edges.append(edges)
+    finally:
+        doc.close()
+
+    body_font = font_sizes.most_common(1)[0][0] if font_sizes else None
+    body_color = text_colors.most_common(1)[0][0] if text_colors else 0
+    repeated = repeated_fingerprints(page_edges, text_pages) if text_pages >= REPEATED_MIN_PAGES else set()
+    return body_font, body_color, repeated
+
+def iter_candidate_blocks(pdf_path, body_font, body_color, min_length=3, max_length=100, repeated=None):
+    """
+    Second pass of two-pass extraction: yield, page by page, only the lines
+    that pass every is_likely_heading check. Font criteria are tested on span
+    metadata before any text is merged, so allocations scale with the number
+    of headings rather than the number of lines. Lines whose fingerprint is
+    in repeated (from scan_body_style) are dropped as running headers/footers.
+    """
     if body_font is None:
-        return False
-        
+        return
+
+    def font_ok(font_size, is_bold, text_color):
+        return passes_font_criteria(font_size, bool(is_bold), text_color, body_font, body_color)
+
+    for blocks in iter_page_blocks(pdf_path, line_filter=font_ok):
+        keep = (blocks.char_length >= min_length) & (blocks.char_length <= max_length)
+        for i in np.flatnonzero(keep):
+            if not passes_text_filters(blocks.text[i]):
+                keep[i] = False
+            elif repeated and line_fingerprint(blocks.text[i], int(blocks.y[i]), int(blocks.page[i])) in repeated:
+                keep[i] = False
+        yield blocks.take(np.flatnonzero(keep))
+
+def page_count(pdf_path):
+    with open_pdf(pdf_path) as doc:
+        return doc.page_count
+
+def shard_ranges(n_pages, pages_per_shard):
+    """Split n_pages into contiguous (start, stop) ranges of at most pages_per_shard pages."""
+    return [
+        (start, min(start + pages_per_shard, n_pages))
+        for start in range(0, n_pages, pages_per_shard)
+    ]
+
+def extract_shard(pdf_path, start, stop):
+    """
+    Extract pages [start, stop) of a PDF into one BlockTable; each call
+    opens its own fitz handle.
+    """
+    with PROFILER.stage("extract_blocks") as stage:
+        pages = list(iter_page_blocks(pdf_path, page_range=(start, stop)))
+        blocks = BlockTable.concatenate(pages)
+        stage.count(pages=len(pages), lines=len(blocks))
+    return blocks
+
+def merge_shards(shards, drop_repeated=True):
+    """
+    Combine extract_shard tables, given in page order, into extract_blocks
+    output. Body font/color are taken over the concatenated columns, so ties
+    resolve to the value seen first, exactly as in a serial run. Running
+    headers/footers are then removed over the whole document (drop_repeated_lines)
+    unless drop_repeated is False; body style is measured before removal, as
+    in the streaming first pass.
+    """
+    blocks = BlockTable.concatenate(shards)
+    body_font, body_color = blocks.body_style()
+    if drop_repeated:
+        blocks = drop_repeated_lines(blocks)
+    return blocks, body_font, body_color
+
+def extract_blocks(pdf_path, page_range=None, drop_repeated=True):
+    """
+    Extract merged text lines from a PDF (optionally a 0-based page range) as
+    (BlockTable, body font size, body text color). Running headers, footers
+    and page numbers repeated across pages are dropped unless drop_repeated
+    is False.
+    """
+    start, stop = page_range or (0, page_count(pdf_path))
+    return merge_shards([extract_shard(pdf_path, start, stop)], drop_repeated)
+
+def passes_font_criteria(font_size, is_bold, text_color, body_font, body_color) -> bool:
+    """Font-based criteria with tolerance (works on scalars and NumPy arrays)."""
     font_tolerance = body_font * 0.1
-    
+
     # Check if text has different color from body text (treat as bold-like emphasis)
     has_different_color = text_color != body_color
-    
+
     # Consider as heading if:
     # 1. Larger font size, OR
     # 2. Same size and bold, OR
     # 3. Same size and different color (new condition)
-    if (font_size > (body_font + font_tolerance) or 
-        (font_size >= (body_font - font_tolerance) and is_bold) or
-        (font_size >= (body_font - font_tolerance) and has_different_color)):
-        return True
-    
-    return False
+    return (font_size > (body_font + font_tolerance)) | (
+        (font_size >= (body_font - font_tolerance)) & (is_bold | has_different_color)
+    )
+
+def passes_text_filters(text: str) -> bool:
+    """
+    Text-only checks of is_likely_heading, fused into one character scan that
+    counts whitespace, spaces, alphanumerics and math symbols together. Cheap
+    ratio tests run before the regex alternations.
+    """
+    total_chars = len(text)
+    if not total_chars:
+        return False
+
+    whitespace = spaces = alnum = math_count = 0
+    math_symbols = MATH_SYMBOLS
+    for char in text:
+        if char.isspace():
+            whitespace += 1
+            if char == ' ':
+                spaces += 1
+            continue
+        if char.isalnum():
+            alnum += 1
+        if char in math_symbols:
+            math_count += 1
+
+    # Check for excessive whitespace (>30%)
+    if whitespace / total_chars > 0.30:
+        return False
+
+    non_space = total_chars - spaces
+    if non_space:
+        # Check if mostly symbols or special characters
+        if alnum / non_space < 0.5:
+            return False
+        # Check for mathematical content: symbols alone, then symbols + patterns
+        if math_count / non_space > 0.15:
+            return False
+
+    if SKIP_RE.match(text):
+        return False
+
+    if non_space and (math_count + count_math_patterns(text) * 2) / non_space > 0.15:
+        return False
+    return True
+
+def is_likely_heading(text: str, font_size: float, is_bold: bool, text_color: int, body_font: float, body_color: int) -> bool:
+    """Comprehensive heading detection with improved filtering"""
+    if body_font is None:
+        return False
+    # Arithmetic font checks first; they reject most body lines for free
+    if not passes_font_criteria(font_size, bool(is_bold), text_color, body_font, body_color):
+        return False
+    return passes_text_filters(text)
+
+def likely_heading_mask(texts, font_sizes, is_bold, text_colors, body_font, body_color, mask=None) -> np.ndarray:
+    """
+    Vectorized is_likely_heading over many lines of one document.
+    Font criteria run as array expressions; the text scan only runs on lines
+    that survive them (and the optional pre-computed mask, e.g. a length filter).
+    """
+    n = len(texts)
+    if body_font is None or not n:
+        return np.zeros(n, dtype=bool)
+
+    keep = passes_font_criteria(
+        np.asarray(font_sizes, dtype=np.float64),
+        np.asarray(is_bold, dtype=bool),
+        np.asarray(text_colors, dtype=np.int64),
+        body_font,
+        body_color,
+    )
+    if mask is not None:
+        keep &= mask
+    for i in np.flatnonzero(keep):
+        if not passes_text_filters(texts[i]):
+            keep[i] = False
+    return keep
+
+def likely_heading_indices(blocks, body_font, body_color, min_length, max_length) -> np.ndarray:
+    """Rows of a BlockTable within [min_length, max_length] characters that pass likely_heading_mask."""
+    if not len(blocks):
+        return np.zeros(0, dtype=np.int64)
+    with PROFILER.stage("is_likely_heading") as stage:
+        lengths = blocks.char_length
+        mask = likely_heading_mask(
+            blocks.text,
+            blocks.font_size,
+            blocks.is_bold,
+            blocks.text_color,
+            body_font,
+            body_color,
+            mask=(lengths >= min_length) & (lengths <= max_length),
+        )
+        indices = np.flatnonzero(mask)
+        stage.count(blocks=len(blocks), candidates=len(indices))
+    return indices
+
+def likely_heading_blocks(blocks, body_font, body_color, min_length, max_length):
+    """Sub-table of the rows within [min_length, max_length] characters that pass likely_heading_mask."""
+    return blocks.take(likely_heading_indices(blocks, body_font, body_color, min_length, max_length))
 
 def determine_heading_level(font_size: float, body_font: float) -> str:
     """Determine heading level based on font size"""
@@ -209,75 +696,82 @@ def determine_heading_level(font_size: float, body_font: float) -> str:
     else:
         return "H3"
 
-def main():
+def scan_document(path):
+    """Extract and heuristically classify one PDF; returns (fname, csv rows, outline)."""
+    fname = os.path.basename(path)
+    print(f"→ scanning {fname}")
+    blocks, body_font, body_color = extract_blocks(path)
+
     rows = []
-    all_headings = {}  # For JSON output structure
-    
-    for fname in sorted(os.listdir(INPUT_DIR)):
-        if not fname.lower().endswith(".pdf"):
-            continue
-        path = os.path.join(INPUT_DIR, fname)
-        print(f"→ scanning {fname}")
-        blocks, body_font, body_color = extract_blocks(path)
+    document_headings = []
+    title = "Unknown Document"
 
-        document_headings = []
-        title = "Unknown Document"
-        
-        for b in blocks:
-            fs = b["font_size"]
-            bold = b["is_bold"]
-            text_color = b["text_color"]
-            length = b["char_length"]
-            txt = b["text"]
-
-            # Basic length filter
-            if length <= 3 or length >= 100:
-                continue
+    # Basic length filter + comprehensive heading detection, vectorized per document
+    headings = likely_heading_blocks(blocks, body_font, body_color, min_length=4, max_length=99)
+    for txt, page, fs, bold, text_color, x, y, length in headings.rows():
 
-            # Apply comprehensive heading detection
-            if not is_likely_heading(txt, fs, bold, text_color, body_font, body_color):
-                continue
+        # Determine heading level
+        level = determine_heading_level(fs, body_font)
 
-            # Determine heading level
-            level = determine_heading_level(fs, body_font)
-            
-            # Set title (first H1 or first heading)
-            if not title or title == "Unknown Document":
-                if level == "H1":
-                    title = txt
-                elif title == "Unknown Document":
-                    title = txt
-
-            # Check if text has different color and treat as bold
-            has_different_color = text_color != body_color
-            effective_bold = bold or has_different_color
-
-            heading_entry = {
-                "level": level,
-                "text": txt,
-                "page": b["page"]
-            }
-            document_headings.append(heading_entry)
-
-            rows.append({
-                "document": fname,
-                "page": b["page"],
-                "text": txt,
-                "font_size": fs,
-                "is_bold": int(effective_bold),  # Use effective bold (including color difference)
-                "x": b["x"],
-                "y": b["y"],
-                "char_length": length,
-                "body_font_size": body_font,
-                "heading_level": level,
-                "heading": 1
-            })
-        
-        # Store for JSON output
-        all_headings[fname] = {
-            "title": title,
-            "outline": document_headings
+        # Set title (first H1 or first heading)
+        if not title or title == "Unknown Document":
+            if level == "H1":
+                title = txt
+            elif title == "Unknown Document":
+                title = txt
+
+        # Check if text has different color and treat as bold
+        has_different_color = text_color != body_color
+        effective_bold = bold or has_different_color
+
+        heading_entry = {
+            "level": level,
+            "text": txt,
+            "page": page
         }
+        document_headings.append(heading_entry)
+
+        rows.append({
+            "document": fname,
+            "page": page,
+            "text": txt,
+            "font_size": fs,
+            "is_bold": int(effective_bold),  # Use effective bold (including color difference)
+            "x": x,
+            "y": y,
+            "char_length": length,
+            "body_font_size": body_font,
+            "heading_level": level,
+            "heading": 1
+        })
+
+    return fname, rows, {"title": title, "outline": document_headings}
+
+def scan_documents(paths, workers=1):
+    """Scan PDFs serially or over a process pool; results keep the order of paths."""
+    if workers <= 1 or len(paths) <= 1:
+        return [scan_document(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        return list(pool.map(scan_document, paths))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes used for per-document extraction (0 = all CPUs)")
+    args = parser.parse_args()
+
+    paths = [
+        os.path.join(INPUT_DIR, fname)
+        for fname in sorted(os.listdir(INPUT_DIR))
+        if fname.lower().endswith(".pdf")
+    ]
+    workers = args.workers or os.cpu_count() or 1
+
+    rows = []
+    all_headings = {}  # For JSON output structure
+    for fname, doc_rows, outline in scan_documents(paths, workers=workers):
+        rows.extend(doc_rows)
+        all_headings[fname] = outline
 
     # Write CSV output
     with open(OUTPUT_CSV, "w", newline="", encoding="utf-8-sig") as f:
@@ -0,0 +1,81 @@
+"""
+Import-time report: how long each entry module takes to import in a fresh
+interpreter, and which heavy third-party packages that import drags in.
+
+    python import_report.py [--top N] [--json PATH] [module ...]
+
+Uses `python -X importtime`, so numbers are the interpreter's own
+per-module measurements (microseconds, reported here in ms).
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+
+ENTRY_MODULES = (
+    "outline_extractor", "section_index", "service", "streaming", "ranker",
+    "persona_module", "extract_candidates", "utils", "cache",
+)
+# Packages that should only load in the stages that use them
+HEAVY_PACKAGES = ("fitz", "pymupdf", "onnxruntime", "sklearn", "joblib", "tokenizers", "transformers", "torch")
+
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def measure(module):
+    """Per-module (self_us, cumulative_us, name, depth) rows of `import module` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us), int(cumulative_us), name, len(indent) // 2))
+    return rows
+
+def report(module, top=5):
+    rows = measure(module)
+    total_us = next(cum for _, cum, name, _ in reversed(rows) if name == module)
+    heavy = {}
+    for _, cum, name, _ in rows:
+        root = name.split(".")[0]
+        if root in HEAVY_PACKAGES and name == root:
+            heavy[root] = round(cum / 1000, 1)
+    # Largest subtrees directly below the entry module's own imports
+    top_level = sorted(
+        ((cum, name) for _, cum, name, depth in rows if depth == 1),
+        reverse=True,
+    )[:top]
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "heavy_packages_ms": heavy,
+        "largest_imports_ms": {name: round(cum / 1000, 1) for cum, name in top_level},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import time of the pipeline's entry modules")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_MODULES))
+    parser.add_argument("--top", type=int, default=5, help="Largest direct imports listed per module")
+    parser.add_argument("--json", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    reports = [report(module, args.top) for module in args.modules]
+    for r in reports:
+        heavy = ", ".join(f"{name} {ms}ms" for name, ms in r["heavy_packages_ms"].items()) or "none"
+        print(f"⏱ {r['module']:<20} {r['total_ms']:>8.1f}ms  heavy: {heavy}")
+        for name, ms in r["largest_imports_ms"].items():
+            print(f"    {name:<28} {ms:>8.1f}ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        print(f"✅ Report saved to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -149,124 +149,471 @@
 
 #!/usr/bin/env python3
 import os
+import sys
 import json
 import datetime
-
-from extract_candidates import extract_blocks, normalize_text, is_likely_heading
-from utils import HeadingDetector
-from persona_module import PersonaEmbedder
-from ranker import rank_sections
+import argparse
+from concurrent.futures import ProcessPoolExecutor, Future
+from functools import partial
+
+import numpy as np
+
+from extract_candidates import (
+    extract_blocks, likely_heading_indices, page_count, shard_ranges, extract_shard, merge_shards
+)
+from utils import HeadingDetector, classify_headings
+from cache import ExtractionCache
+from persona_module import get_embedder, GRAPH_OPTIMIZATION_LEVELS, MODEL_VARIANTS
+from ranker import rank_sections, rank_section_chunks, rank_sections_multi
+from dedup import collapse_boilerplate
+from sections import attach_sections, CHUNK_WORDS, CHUNK_TOKENS, MAX_CHUNKS
+from streaming import stream_candidates, iter_scored, StreamWriter
+from profiling import PROFILER, submit_profiled, profiled_result, print_summary
 
 INPUT_DIR = "input"
 OUTPUT_DIR = "output"
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "final_output.json")
+# Streamed records carry a score instead of importance_rank, so they never overwrite OUTPUT_FILE
+STREAM_OUTPUT_FILES = {
+    "jsonl": os.path.join(OUTPUT_DIR, "final_output.jsonl"),
+    "json": os.path.join(OUTPUT_DIR, "final_output.stream.json"),
+}
+# None lets HeadingDetector pick model/heading_model.npz, falling back to the pickle
+HEADING_MODEL_PATH = None
 
 # Load persona and job from the first JSON file found
-def load_persona_and_job():
-    for file in os.listdir(INPUT_DIR):
+def load_persona_and_job(input_dir=INPUT_DIR):
+    for file in os.listdir(input_dir):
         if file.endswith(".json"):
-            with open(os.path.join(INPUT_DIR, file), "r", encoding="utf-8") as f:
+            with open(os.path.join(input_dir, file), "r", encoding="utf-8") as f:
                 meta = json.load(f)
-            persona = meta["persona"]["role"]
-            job = meta["job_to_be_done"]["task"]
-            return persona, job
-    raise FileNotFoundError("No JSON metadata file found in input/")
-
-def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-    # Load persona + job
-    persona, job = load_persona_and_job()
-    print(f"🧠 Persona: {persona}")
-    print(f"🎯 Job to be done: {job}")
-
-    # Load models
-    detector = HeadingDetector(model_path="model/heading_model.pkl")
-    persona_embedder = PersonaEmbedder()
-    persona_emb = persona_embedder.embed([f"{persona}. {job}"])[0]
-
-
-    extracted_sections = []
-    subsection_analysis = []
-    input_documents = []
-
-    for fname in sorted(os.listdir(INPUT_DIR)):
-        if not fname.lower().endswith(".pdf"):
-            continue
-        input_documents.append(fname)
-        pdf_path = os.path.join(INPUT_DIR, fname)
-        print(f"→ Processing {fname}")
-
-        blocks, body_font, body_color = extract_blocks(pdf_path)
-
-        candidates = []
-        for b in blocks:
-            text = normalize_text(b["text"])
-            if len(text) < 3 or len(text) > 100:
+            return parse_persona_and_job(meta)
+    raise FileNotFoundError(f"No JSON metadata file found in {input_dir}/")
+
+def parse_persona_and_job(meta):
+    """Persona role and job task of a challenge input JSON."""
+    return meta["persona"]["role"], meta["job_to_be_done"]["task"]
+
+def load_requests(path):
+    """
+    Persona/job requests for batch mode, from a directory of challenge
+    input JSONs or a JSON Lines file with one challenge input per line.
+    Each request is a dict with "id" (file name stem, or the line's
+    request_id, else its challenge_id, else its line number: lines against
+    one collection usually share a challenge_id), "persona", "job" and
+    "documents" (the PDF names it lists, or None for the whole input).
+    Ids name the output files, so ids that are not plain file names are
+    rejected.
+    """
+    entries = []
+    if os.path.isdir(path):
+        for fname in sorted(os.listdir(path)):
+            if fname.endswith(".json"):
+                with open(os.path.join(path, fname), "r", encoding="utf-8") as f:
+                    entries.append((os.path.splitext(fname)[0], json.load(f)))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    meta = json.loads(line)
+                    request_id = (meta.get("request_id") or meta.get("challenge_info", {}).get("challenge_id")
+                                  or f"request_{line_no:03d}")
+                    entries.append((str(request_id), meta))
+
+    requests = []
+    seen = set()
+    for request_id, meta in entries:
+        if request_id in seen:
+            raise ValueError(f"Duplicate request id {request_id!r} in {path}")
+        if (request_id in ("", ".", "..") or os.path.basename(request_id) != request_id
+                or any(sep in request_id for sep in ("/", "\\", os.sep))):
+            raise ValueError(f"Invalid request id {request_id!r} in {path}: must be a plain file name")
+        seen.add(request_id)
+        persona, job = parse_persona_and_job(meta)
+        documents = [d["filename"] for d in meta["documents"]] if meta.get("documents") else None
+        requests.append({"id": request_id, "persona": persona, "job": job, "documents": documents})
+    return requests
+
+def select_candidates(fname, blocks, body_font, body_color, detector, threshold=None, section_chunks=None):
+    """
+    Heuristic filter + batch classification of one document's extracted blocks.
+    section_chunks=(chunk_size, max_chunks, max_tokens) also attaches each heading's body
+    text as "chunks" (see sections.attach_sections).
+    """
+    indices = likely_heading_indices(blocks, body_font, body_color, min_length=3, max_length=100)
+    survivors = blocks.take(indices)
+    # Classify all surviving blocks of the document in one batch
+    candidates = classify_headings(
+        detector, survivors, body_font, body_color, fname, threshold,
+        indices=indices if section_chunks else None,
+    )
+    if section_chunks:
+        attach_sections(candidates, blocks, *section_chunks)
+    return candidates
+
+def detect_candidates(pdf_path, detector, threshold=None, extraction_cache=None, section_chunks=None,
+                      drop_repeated=True):
+    """
+    Extract one PDF and return its classified heading candidates.
+    With an extraction cache, unchanged PDFs are not re-parsed.
+    drop_repeated=False keeps running headers/footers (see extract_blocks).
+    """
+    fname = os.path.basename(pdf_path)
+    print(f"→ Processing {fname}")
+
+    extract = partial(extract_blocks, drop_repeated=drop_repeated)
+    if extraction_cache is not None:
+        blocks, body_font, body_color = extraction_cache.get_or_extract(pdf_path, extract)
+    else:
+        blocks, body_font, body_color = extract(pdf_path)
+    return select_candidates(fname, blocks, body_font, body_color, detector, threshold, section_chunks)
+
+# Per-process state for pool workers, set up once by _init_worker
+_WORKER_DETECTOR = None
+_WORKER_THRESHOLD = None
+_WORKER_CACHE = None
+_WORKER_SECTION_CHUNKS = None
+_WORKER_DROP_REPEATED = True
+
+def _init_worker(model_path, threshold, cache_dir, section_chunks, drop_repeated=True):
+    global _WORKER_DETECTOR, _WORKER_THRESHOLD, _WORKER_CACHE, _WORKER_SECTION_CHUNKS, _WORKER_DROP_REPEATED
+    _WORKER_DETECTOR = HeadingDetector(model_path=model_path)
+    _WORKER_THRESHOLD = threshold
+    _WORKER_CACHE = ExtractionCache(cache_dir, drop_repeated) if cache_dir else None
+    _WORKER_SECTION_CHUNKS = section_chunks
+    _WORKER_DROP_REPEATED = drop_repeated
+
+def _detect_in_worker(pdf_path):
+    return detect_candidates(pdf_path, _WORKER_DETECTOR, _WORKER_THRESHOLD, _WORKER_CACHE, _WORKER_SECTION_CHUNKS,
+                             _WORKER_DROP_REPEATED)
+
+def collect_candidates(pdf_paths, workers=1, model_path=HEADING_MODEL_PATH, threshold=None,
+                       cache_dir=None, shard_pages=None, section_chunks=None, drop_repeated=True):
+    """
+    Run extraction and heading detection for every PDF.
+    With workers > 1 documents are spread over a process pool; results
+    always come back in the order of pdf_paths. cache_dir enables the
+    per-document extraction cache. With shard_pages, documents longer than
+    that are split into page-range shards extracted on the same pool and
+    merged in the parent, so one huge PDF no longer runs serially.
+    section_chunks is passed through to select_candidates; drop_repeated=False
+    keeps running headers/footers.
+    """
+    if workers <= 1 or (len(pdf_paths) <= 1 and not shard_pages):
+        detector = HeadingDetector(model_path=model_path)
+        cache = ExtractionCache(cache_dir, drop_repeated) if cache_dir else None
+        return [detect_candidates(path, detector, threshold, cache, section_chunks, drop_repeated)
+                for path in pdf_paths]
+
+    # The parent only extracts/classifies sharded or already-cached documents itself
+    detector = HeadingDetector(model_path=model_path) if shard_pages else None
+    cache = ExtractionCache(cache_dir, drop_repeated) if cache_dir and shard_pages else None
+
+    with ProcessPoolExecutor(
+        max_workers=workers if shard_pages else min(workers, len(pdf_paths)),
+        initializer=_init_worker,
+        initargs=(model_path, threshold, cache_dir, section_chunks, drop_repeated),
+    ) as pool:
+        pending = []
+        for path in pdf_paths:
+            n_pages = page_count(path) if shard_pages else 0
+            if n_pages <= (shard_pages or 0):
+                pending.append((path, submit_profiled(pool, _detect_in_worker, path)))
                 continue
-            if not is_likely_heading(
-                text,
-                b["font_size"],
-                bool(b["is_bold"]),
-                b["text_color"],
-                body_font,
-                body_color
-            ):
+            cached = cache.load(path) if cache is not None else None
+            if cached is not None:
+                pending.append((path, cached))
                 continue
-
-            b["effective_bold"] = int(b["is_bold"] or b["text_color"] != body_color)
-            features = {
-                "font_size": b["font_size"],
-                "is_bold": b["effective_bold"],
-                "x": b["x"],
-                "y": b["y"],
-                "char_length": b["char_length"],
-                "body_font_size": body_font,
-                "text": text
-            }
-
-            if not detector.is_heading(features):
+            print(f"→ Processing {os.path.basename(path)} in {-(-n_pages // shard_pages)} shards")
+            shards = [submit_profiled(pool, extract_shard, path, start, stop)
+                      for start, stop in shard_ranges(n_pages, shard_pages)]
+            pending.append((path, shards))
+
+        results = []
+        for path, work in pending:
+            if isinstance(work, Future):
+                results.append(profiled_result(work))
                 continue
-
-            candidates.append({
-                "text": text,
-                "page": b["page"],
-                "font_size": b["font_size"],
-                "document": fname
-            })
-
-        ranked = rank_sections(candidates, persona_emb)
-
-        for idx, sec in enumerate(ranked):
-            extracted_sections.append({
-                "document": sec["document"],
-                "section_title": sec["text"],
-                "importance_rank": len(extracted_sections) + 1,
-                "page_number": sec["page"]
-            })
-            subsection_analysis.append({
-                "document": sec["document"],
-                "refined_text": sec["text"],
-                "page_number": sec["page"]
-            })
-
-    metadata = {
+            if isinstance(work, list):
+                work = merge_shards([profiled_result(f) for f in work], drop_repeated)
+                if cache is not None:
+                    cache.store(path, *work)
+            results.append(select_candidates(os.path.basename(path), *work, detector, threshold, section_chunks))
+        return results
+
+def load_embedder(args):
+    """Build (or reuse) the process-wide embedder configured from the command line."""
+    embedder = get_embedder(
+        variant=args.model_variant,
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+        graph_optimization=args.graph_optimization,
+        cache_dir=os.path.join(args.cache_dir, "embeddings") if args.cache_dir else None,
+        cache_size=args.embedding_cache_size,
+        batch_size=args.embed_batch_size,
+        max_length=args.max_seq_length,
+    )
+    if args.warmup:
+        embedder.warmup(args.warmup)
+    return embedder
+
+def make_metadata(input_documents, persona, job):
+    return {
         "input_documents": input_documents,
         "persona": persona,
         "job_to_be_done": job,
         "processing_timestamp": datetime.datetime.utcnow().isoformat()
     }
 
-    final_output = {
+def write_output(path, metadata, ranked):
+    """Write ranked sections in the challenge output format."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(build_output(metadata, ranked), f, indent=2, ensure_ascii=False)
+
+def build_output(metadata, ranked):
+    """Challenge output document for ranked sections."""
+    extracted_sections = []
+    subsection_analysis = []
+    for idx, sec in enumerate(ranked):
+        extracted_sections.append({
+            "document": sec["document"],
+            "section_title": sec["text"],
+            "importance_rank": idx + 1,
+            "page_number": sec["page"]
+        })
+        subsection_analysis.append({
+            "document": sec["document"],
+            "refined_text": sec.get("refined_text", sec["text"]),
+            "page_number": sec["page"]
+        })
+
+    return {
         "metadata": metadata,
         "extracted_sections": extracted_sections,
         "subsection_analysis": subsection_analysis
     }
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(final_output, f, indent=2, ensure_ascii=False)
+def run_batch(args, requests, candidates, input_documents):
+    """
+    Answer every request from one extraction pass: all personas are
+    embedded in one batch and ranked with one matrix product. Writes one
+    output file per request into --batch-output-dir.
+    """
+    persona_embedder = load_embedder(args)
+    persona_embs = persona_embedder.embed([f"{r['persona']}. {r['job']}" for r in requests])
+
+    documents = np.array([c["document"] for c in candidates])
+    masks = []
+    for request in requests:
+        missing = set(request["documents"] or ()) - set(input_documents)
+        if missing:
+            print(f"⚠️ {request['id']}: not in {INPUT_DIR}: {', '.join(sorted(missing))}")
+        masks.append(np.ones(len(candidates), dtype=bool) if request["documents"] is None
+                     else np.isin(documents, request["documents"]))
+
+    rankings = rank_sections_multi(candidates, persona_embs, embedder=persona_embedder,
+                                   top_k=args.top_k, masks=masks)
+
+    os.makedirs(args.batch_output_dir, exist_ok=True)
+    for request, ranked in zip(requests, rankings):
+        request_documents = sorted(set(request["documents"]) & set(input_documents)) if request["documents"] else input_documents
+        metadata = make_metadata(request_documents, request["persona"], request["job"])
+        write_output(os.path.join(args.batch_output_dir, f"{request['id']}.json"), metadata, ranked)
+    return persona_embedder
+
+def run_stream(args, pdf_paths, input_documents, persona, job):
+    """
+    Bounded-memory mode: documents are processed serially page by page,
+    candidates are embedded in rolling batches and sections are written as
+    soon as they are scored.
+    """
+    detector = HeadingDetector(model_path=HEADING_MODEL_PATH)
+    persona_embedder = load_embedder(args)
+    persona_emb = persona_embedder.embed([f"{persona}. {job}"])[0]
+
+    candidates = (
+        candidate
+        for path in pdf_paths
+        for candidate in stream_candidates(path, detector, os.path.basename(path), args.heading_threshold,
+                                           sample_pages=args.sample_pages,
+                                           drop_repeated=not args.keep_repeated_lines)
+    )
+    out_path = STREAM_OUTPUT_FILES[args.stream]
+    metadata = make_metadata(input_documents, persona, job)
+    with StreamWriter(out_path, metadata, fmt=args.stream) as out:
+        for sec, score in iter_scored(candidates, persona_embedder, persona_emb, args.stream_batch_size):
+            out.write({
+                "document": sec["document"],
+                "section_title": sec["text"],
+                "page_number": sec["page"],
+                "score": round(score, 6)
+            })
+
+    print(f"✅ Done. Streamed {out.count} sections to {out_path}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes used for per-document extraction (0 = all CPUs)")
+    parser.add_argument("--stream", choices=["jsonl", "json"], default=None,
+                        help="Bounded-memory mode: write scored sections incrementally as JSON Lines or a streamed JSON array")
+    parser.add_argument("--requests", default=None,
+                        help="Batch mode: a directory of challenge input JSONs or a JSON Lines file of requests; "
+                             "documents are extracted and embedded once for all of them")
+    parser.add_argument("--batch-output-dir", default=os.path.join(OUTPUT_DIR, "batch"),
+                        help="Where batch mode writes one <request id>.json per request")
+    parser.add_argument("--stream-batch-size", type=int, default=256,
+                        help="Candidates embedded per rolling batch in --stream mode")
+    parser.add_argument("--sample-pages", type=int, default=None,
+                        help="In --stream mode, estimate body font/color from this many evenly spaced pages")
+    parser.add_argument("--titles-only", action="store_true",
+                        help="Rank headings by their title alone instead of their best body chunk")
+    parser.add_argument("--chunk-words", type=int, default=CHUNK_WORDS,
+                        help="Words per section body chunk")
+    parser.add_argument("--max-chunks", type=int, default=MAX_CHUNKS,
+                        help="Maximum body chunks embedded per section")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS,
+                        help="Wordpiece tokens per section body chunk, [CLS]/[SEP] included (0 = bound by --chunk-words only)")
+    parser.add_argument("--keep-repeated-lines", action="store_true",
+                        help="Keep running headers, footers and page numbers repeated across pages")
+    parser.add_argument("--collapse-boilerplate", type=int, default=0, metavar="N",
+                        help="Keep only the first of headings repeated on N or more pages of a document (0 = off)")
+    parser.add_argument("--top-k", type=int, default=None,
+                        help="Only output the K best-ranked sections across all documents")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory for persistent caches (disabled when omitted)")
+    parser.add_argument("--embedding-cache-size", type=int, default=50000,
+                        help="Maximum number of cached embeddings before LRU eviction")
+    parser.add_argument("--model-variant", choices=sorted(MODEL_VARIANTS), default="fp32",
+                        help="Embedding model produced by export_onnx.py")
+    parser.add_argument("--embed-batch-size", type=int, default=32,
+                        help="Texts per ONNX run; inputs are sorted by token length first")
+    parser.add_argument("--max-seq-length", type=int, default=None,
+                        help="Truncate embedding inputs to this many tokens (default: tokenizer maximum)")
+    parser.add_argument("--shard-pages", type=int, default=None,
+                        help="With --workers, split documents longer than N pages into N-page shards across the pool")
+    parser.add_argument("--intra-op-threads", type=int, default=0,
+                        help="ONNX intra-op threads (0 = onnxruntime default)")
+    parser.add_argument("--inter-op-threads", type=int, default=0,
+                        help="ONNX inter-op threads (0 = onnxruntime default)")
+    parser.add_argument("--graph-optimization", choices=sorted(GRAPH_OPTIMIZATION_LEVELS), default="all",
+                        help="ONNX graph optimization level")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Number of warm-up runs before embedding (0 to skip)")
+    parser.add_argument("--profile", default=None, metavar="PATH",
+                        help="Write a JSON report of per-stage wall/CPU time, counts, batch sizes and peak RSS")
+    parser.add_argument("--cprofile", default=None, metavar="PATH",
+                        help="Also dump cProfile stats of the main process (read with pstats)")
+    parser.add_argument("--heading-threshold", type=float, default=None,
+                        help="Keep headings whose classifier probability is at least this (default: model.predict)")
+    args = parser.parse_args(argv)
+    if args.requests and args.stream:
+        parser.error("--requests cannot be combined with --stream")
+    return args
 
-    print(f"✅ Done. Final output saved to {OUTPUT_FILE}")
+def main():
+    args = parse_args()
+    if not (args.profile or args.cprofile):
+        run_pipeline(args)
+        return
+
+    PROFILER.enable()
+    if args.cprofile:
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            persona_embedder = profile.runcall(run_pipeline, args)
+        finally:
+            profile.dump_stats(args.cprofile)
+        print(f"📈 cProfile stats saved to {args.cprofile}")
+    else:
+        persona_embedder = run_pipeline(args)
+
+    embedder_timing = persona_embedder.timing_report() if persona_embedder else None
+    report = PROFILER.report(embedder=embedder_timing, argv=sys.argv[1:])
+    print_summary(report)
+    if args.profile:
+        with open(args.profile, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📈 Profile saved to {args.profile}")
+
+def run_pipeline(args):
+    """Run the pipeline for parsed arguments; returns the embedder used (None in --stream mode)."""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    input_documents = sorted(
+        fname for fname in os.listdir(INPUT_DIR) if fname.lower().endswith(".pdf")
+    )
+
+    # Load persona + job
+    if args.requests:
+        requests = load_requests(args.requests)
+        print(f"🧠 {len(requests)} persona requests from {args.requests}")
+        if all(r["documents"] for r in requests):
+            # Only extract documents some request asks for
+            wanted = {name for r in requests for name in r["documents"]}
+            input_documents = [fname for fname in input_documents if fname in wanted]
+    else:
+        persona, job = load_persona_and_job()
+        print(f"🧠 Persona: {persona}")
+        print(f"🎯 Job to be done: {job}")
+    pdf_paths = [os.path.join(INPUT_DIR, fname) for fname in input_documents]
+
+    if args.stream:
+        with PROFILER.stage("pipeline.stream"):
+            run_stream(args, pdf_paths, input_documents, persona, job)
+        return None
+
+    # Extract + detect headings first so pool workers are forked before the ONNX session exists
+    workers = args.workers or os.cpu_count() or 1
+    with PROFILER.stage("pipeline.collect_candidates", documents=len(pdf_paths)) as stage:
+        candidates_per_doc = collect_candidates(
+            pdf_paths,
+            workers=workers,
+            threshold=args.heading_threshold,
+            cache_dir=os.path.join(args.cache_dir, "extraction") if args.cache_dir else None,
+            shard_pages=args.shard_pages,
+            section_chunks=None if args.titles_only else (args.chunk_words, args.max_chunks, args.chunk_tokens or None),
+            drop_repeated=not args.keep_repeated_lines,
+        )
+        stage.count(candidates=sum(len(c) for c in candidates_per_doc))
+
+    if args.collapse_boilerplate:
+        with PROFILER.stage("pipeline.collapse_boilerplate") as stage:
+            before = sum(len(c) for c in candidates_per_doc)
+            candidates_per_doc = [collapse_boilerplate(c, args.collapse_boilerplate) for c in candidates_per_doc]
+            dropped = before - sum(len(c) for c in candidates_per_doc)
+            stage.count(dropped=dropped)
+        print(f"🧹 Collapsed {dropped} repeated boilerplate headings")
+
+    candidates = [c for doc_candidates in candidates_per_doc for c in doc_candidates]
+    if args.requests:
+        persona_embedder = run_batch(args, requests, candidates, input_documents)
+        output_location = args.batch_output_dir
+    else:
+        # Load embedding model
+        with PROFILER.stage("pipeline.load_embedder"):
+            persona_embedder = load_embedder(args)
+        persona_emb = persona_embedder.embed([f"{persona}. {job}"])[0]
+
+        # Rank every candidate of the collection against the persona in one pass
+        if args.titles_only:
+            ranked = rank_sections(candidates, persona_emb, embedder=persona_embedder, top_k=args.top_k)
+        else:
+            ranked = rank_section_chunks(candidates, persona_emb, embedder=persona_embedder, top_k=args.top_k)
+
+        with PROFILER.stage("pipeline.write_output", sections=len(ranked)):
+            metadata = make_metadata(input_documents, persona, job)
+            write_output(OUTPUT_FILE, metadata, ranked)
+        output_location = OUTPUT_FILE
+
+    timing = persona_embedder.timing_report()
+    print(f"⏱ Embedder: load {timing['load_time_s']}s, warm-up {timing['warmup_time_s']}s, "
+          f"inference {timing['inference_time_s']}s over {timing['inference_calls']} calls, "
+          f"{timing['cache_hits']} cache hits")
+    print(f"✅ Done. Final output saved to {output_location}")
+    return persona_embedder
 
 if __name__ == "__main__":
     main()
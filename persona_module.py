@@ -16,20 +16,240 @@
 #         outputs = self.session.run(["pooler_output"], inputs)
 #         return outputs[0]  # shape: (batch_size, hidden_dim)
 
-import onnxruntime as ort
-from transformers import AutoTokenizer
+import json
+import os
+import time
+
 import numpy as np
 
+from cache import EmbeddingCache
+from profiling import PROFILER
+
+DEFAULT_TOKENIZER_PATH = "model/tokenizer"
+
+# Model files produced by export_onnx.py
+MODEL_VARIANTS = {
+    "fp32": "model/all-MiniLM-L6-v2.onnx",
+    "optimized": "model/all-MiniLM-L6-v2.opt.onnx",
+    "int8": "model/all-MiniLM-L6-v2.int8.onnx",
+}
+DEFAULT_MODEL_PATH = MODEL_VARIANTS["fp32"]
+
+# Output of graphs that pool and normalize in-graph (see export_onnx.py)
+POOLED_OUTPUT = "sentence_embedding"
+
+# Names of ort.GraphOptimizationLevel members; onnxruntime is only imported when a session is built
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+def load_tokenizer(tokenizer_path=DEFAULT_TOKENIZER_PATH):
+    """
+    Fast tokenizer straight from tokenizer.json, without importing transformers.
+    Returns (tokenizer, model_max_length, pad_id). The padding and truncation
+    stored in tokenizer.json are cleared; PersonaEmbedder pads per sub-batch
+    and sets truncation per call.
+    """
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(os.path.join(tokenizer_path, "tokenizer.json"))
+    tokenizer.no_padding()
+    tokenizer.no_truncation()
+    with open(os.path.join(tokenizer_path, "tokenizer_config.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    pad_id = tokenizer.token_to_id(config.get("pad_token", "[PAD]")) or 0
+    return tokenizer, config.get("model_max_length", 512), pad_id
+
 class PersonaEmbedder:
-    def __init__(self, model_path="model/all-MiniLM-L6-v2.onnx", tokenizer_path="model/tokenizer"):
-        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
-        self.session = ort.InferenceSession(model_path)
-
-    def embed(self, texts):
-        tokens = self.tokenizer(texts, padding=True, truncation=True, return_tensors="np")
-        inputs = {
-            "input_ids": tokens["input_ids"],
-            "attention_mask": tokens["attention_mask"]
+    def __init__(self, model_path=None, tokenizer_path=DEFAULT_TOKENIZER_PATH,
+                 intra_op_threads=0, inter_op_threads=0, graph_optimization="all",
+                 cache_dir=None, cache_size=50000, variant="fp32",
+                 batch_size=32, max_length=None):
+        """
+        Load the tokenizer and build one ONNX session.
+        variant picks one of MODEL_VARIANTS unless model_path is given explicitly.
+        Thread counts of 0 let onnxruntime pick its own defaults.
+        With cache_dir set, embeddings are reused across runs via an on-disk cache.
+        batch_size and max_length are the defaults for embed(); max_length=None
+        uses the tokenizer's model_max_length.
+        """
+        import onnxruntime as ort
+
+        if graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(f"Unknown graph optimization level: {graph_optimization}")
+        if model_path is None:
+            if variant not in MODEL_VARIANTS:
+                raise ValueError(f"Unknown model variant: {variant}")
+            model_path = MODEL_VARIANTS[variant]
+        self.model_path = model_path
+
+        start = time.perf_counter()
+        self.tokenizer, model_max_length, self.pad_id = load_tokenizer(tokenizer_path)
+        self._truncation = None
+        self.batch_size = batch_size
+        self.max_length = max_length or model_max_length
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[graph_optimization])
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        # Older exports only expose last_hidden_state/pooler_output; pool those in NumPy
+        outputs = {o.name: o for o in self.session.get_outputs()}
+        self.pooled_in_graph = POOLED_OUTPUT in outputs
+        output = outputs[POOLED_OUTPUT if self.pooled_in_graph else "last_hidden_state"]
+        # Embedding width for empty inputs; None if the graph leaves it symbolic
+        self._dim = output.shape[-1] if isinstance(output.shape[-1], int) else None
+
+        self.cache = None
+        if cache_dir:
+            self.cache = EmbeddingCache(cache_dir, max_entries=cache_size)
+            self._cache_prefix = self.cache.model_key(model_path, "mean-l2")
+
+        # Timing counters (seconds) for load vs. inference reporting
+        self.load_time = time.perf_counter() - start
+        self.warmup_time = 0.0
+        self.inference_time = 0.0
+        self.inference_calls = 0
+        self.texts_embedded = 0
+        self.cache_hits = 0
+
+    def text_key(self, text):
+        """
+        The tokenizer's normalized form of text: texts with equal keys get
+        the same token ids and therefore the same embedding (see dedup.py).
+        """
+        normalizer = self.tokenizer.normalizer
+        return normalizer.normalize_str(text) if normalizer is not None else text
+
+    @property
+    def dim(self):
+        """Embedding width, read from the session's output shape."""
+        if self._dim is None:
+            self._dim = int(self._run(["dim"], 1, self.max_length).shape[1])
+            self.inference_calls -= 1
+        return self._dim
+
+    def _empty(self):
+        return np.empty((0, self.dim), dtype=np.float32)
+
+    def _session_run(self, input_ids, attention_mask):
+        """Return mean-pooled, L2-normalized embeddings of shape (batch_size, hidden_dim)."""
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if self.pooled_in_graph:
+            return self.session.run([POOLED_OUTPUT], inputs)[0]
+
+        hidden = self.session.run(["last_hidden_state"], inputs)[0]
+        mask = attention_mask[:, :, None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def _run(self, texts, batch_size, max_length):
+        """
+        Tokenize without padding, sort by token length and run fixed-size
+        sub-batches padded only to their own longest sequence. Since attention
+        cost grows quadratically with length, one long text no longer inflates
+        every batch. Rows are returned in the original order.
+        """
+        if len(texts) == 0:
+            return self._empty()
+        if self._truncation != max_length:
+            self.tokenizer.enable_truncation(max_length)
+            self._truncation = max_length
+        encoded = [e.ids for e in self.tokenizer.encode_batch(texts)]
+        lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(encoded))
+        order = np.argsort(lengths, kind="stable")
+        pad_id = self.pad_id
+
+        embeddings = None
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            width = int(lengths[bucket[-1]])
+            input_ids = np.full((len(bucket), width), pad_id, dtype=np.int64)
+            attention_mask = np.zeros((len(bucket), width), dtype=np.int64)
+            for row, i in enumerate(bucket):
+                input_ids[row, :lengths[i]] = encoded[i]
+                attention_mask[row, :lengths[i]] = 1
+
+            batch = self._session_run(input_ids, attention_mask)
+            PROFILER.batch("embed", len(bucket))
+            self.inference_calls += 1
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            embeddings[bucket] = batch
+        return embeddings
+
+    def embed(self, texts, batch_size=None, max_length=None):
+        """
+        Embed texts in length-bucketed sub-batches.
+        batch_size/max_length default to the values given at construction.
+        """
+        batch_size = batch_size or self.batch_size
+        max_length = max_length or self.max_length
+        with PROFILER.stage("embed") as stage:
+            hits_before = self.cache_hits
+            embeddings = self._embed(texts, batch_size, max_length)
+            stage.count(texts=len(texts), cache_hits=self.cache_hits - hits_before)
+        return embeddings
+
+    def _embed(self, texts, batch_size, max_length):
+        if len(texts) == 0:
+            return self._empty()
+        if self.cache is None:
+            return self._timed_run(texts, batch_size, max_length)
+
+        prefix = f"{self._cache_prefix}:{max_length}"
+        keys = [self.cache.key(prefix, t) for t in texts]
+        cached = [self.cache.get(k) for k in keys]
+        missing = [i for i, vec in enumerate(cached) if vec is None]
+        self.cache_hits += len(texts) - len(missing)
+
+        if missing:
+            fresh = self._timed_run([texts[i] for i in missing], batch_size, max_length)
+            self.cache.put_many([keys[i] for i in missing], fresh)
+            for i, vec in zip(missing, fresh):
+                cached[i] = vec
+        return np.stack(cached).astype(np.float32, copy=False)
+
+    def _timed_run(self, texts, batch_size, max_length):
+        start = time.perf_counter()
+        embeddings = self._run(texts, batch_size, max_length)
+        self.inference_time += time.perf_counter() - start
+        self.texts_embedded += len(texts)
+        return embeddings
+
+    def warmup(self, runs=1):
+        """Run throwaway batches so the first real call doesn't pay allocation costs."""
+        start = time.perf_counter()
+        for _ in range(runs):
+            self._run(["warm up"], 1, self.max_length)
+        self.inference_calls -= runs  # warm-up runs are not real inference
+        self.warmup_time += time.perf_counter() - start
+
+    def timing_report(self):
+        return {
+            "load_time_s": round(self.load_time, 4),
+            "warmup_time_s": round(self.warmup_time, 4),
+            "inference_time_s": round(self.inference_time, 4),
+            "inference_calls": self.inference_calls,
+            "texts_embedded": self.texts_embedded,
+            "cache_hits": self.cache_hits,
         }
-        outputs = self.session.run(["pooler_output"], inputs)
-        return outputs[0]  # shape: (batch_size, hidden_dim)
+
+# Process-wide embedding engine, built once on first use
+_ENGINE = None
+
+def get_embedder(**kwargs):
+    """
+    Return the shared PersonaEmbedder, creating it on the first call.
+    Keyword arguments are only honoured by that first call.
+    """
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = PersonaEmbedder(**kwargs)
+    return _ENGINE
@@ -0,0 +1,203 @@
+"""
+Stage-level profiling for the pipeline.
+
+Instrumented code wraps each stage in `PROFILER.stage(name)`; while the
+profiler is disabled (the default) that returns a shared no-op object, so
+the cost is one attribute check per call. When enabled, every stage
+accumulates call count, wall and CPU time, named counters (pages, lines,
+candidates, ...), batch sizes and the process's peak RSS when it finished.
+
+Stages run in pool workers are collected by submitting through
+submit_profiled/profiled_result, which ship each worker's stats back and
+merge them into the parent; merged wall/CPU times are summed over
+processes. Stages may nest, so times of different stages can overlap.
+"""
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def _peak_rss_mb(who=None):
+    """Peak resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss * scale / (1 << 20), 1)
+
+def _new_stats():
+    return {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "counts": {}, "batches": None, "peak_rss_mb": None}
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, **counts):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    __slots__ = ("profiler", "name", "counts", "wall", "cpu")
+
+    def __init__(self, profiler, name, counts):
+        self.profiler = profiler
+        self.name = name
+        self.counts = counts
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu, self.counts)
+        return False
+
+    def count(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        self.stages = {}
+        self.worker_runs = 0
+        self.worker_peak_rss_mb = None
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+
+    def stage(self, name, **counts):
+        """Context manager timing one call of a stage; use .count(...) on it to add counters."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, counts)
+
+    def _stats(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = _new_stats()
+        return stats
+
+    def add(self, name, wall, cpu, counts=None, calls=1):
+        stats = self._stats(name)
+        stats["calls"] += calls
+        stats["wall_s"] += wall
+        stats["cpu_s"] += cpu
+        for key, value in (counts or {}).items():
+            stats["counts"][key] = stats["counts"].get(key, 0) + value
+        rss = _peak_rss_mb()
+        if rss is not None:
+            stats["peak_rss_mb"] = max(stats["peak_rss_mb"] or 0, rss)
+
+    def batch(self, name, size):
+        """Record the size of one batch processed by a stage."""
+        if not self.enabled:
+            return
+        stats = self._stats(name)
+        batches = stats["batches"]
+        if batches is None:
+            stats["batches"] = {"count": 1, "total": size, "min": size, "max": size}
+        else:
+            batches["count"] += 1
+            batches["total"] += size
+            batches["min"] = min(batches["min"], size)
+            batches["max"] = max(batches["max"], size)
+
+    def snapshot(self):
+        return {"stages": self.stages, "peak_rss_mb": _peak_rss_mb()}
+
+    def merge(self, snapshot):
+        """Fold a worker's snapshot() into this profiler."""
+        self.worker_runs += 1
+        if snapshot["peak_rss_mb"] is not None:
+            self.worker_peak_rss_mb = max(self.worker_peak_rss_mb or 0, snapshot["peak_rss_mb"])
+        for name, other in snapshot["stages"].items():
+            stats = self._stats(name)
+            stats["calls"] += other["calls"]
+            stats["wall_s"] += other["wall_s"]
+            stats["cpu_s"] += other["cpu_s"]
+            for key, value in other["counts"].items():
+                stats["counts"][key] = stats["counts"].get(key, 0) + value
+            if other["batches"] is not None:
+                if stats["batches"] is None:
+                    stats["batches"] = dict(other["batches"])
+                else:
+                    stats["batches"]["count"] += other["batches"]["count"]
+                    stats["batches"]["total"] += other["batches"]["total"]
+                    stats["batches"]["min"] = min(stats["batches"]["min"], other["batches"]["min"])
+                    stats["batches"]["max"] = max(stats["batches"]["max"], other["batches"]["max"])
+            if other["peak_rss_mb"] is not None:
+                stats["peak_rss_mb"] = max(stats["peak_rss_mb"] or 0, other["peak_rss_mb"])
+
+    def report(self, **extra):
+        """JSON-serializable summary of everything recorded since reset()."""
+        stages = {}
+        for name, stats in self.stages.items():
+            entry = dict(stats, wall_s=round(stats["wall_s"], 6), cpu_s=round(stats["cpu_s"], 6))
+            if stats["batches"] is not None:
+                entry["batches"] = dict(stats["batches"], mean=round(stats["batches"]["total"] / stats["batches"]["count"], 2))
+            stages[name] = entry
+        return dict({
+            "total_wall_s": round(time.perf_counter() - self.started, 6),
+            "total_cpu_s": round(time.process_time() - self.started_cpu, 6),
+            "peak_rss_mb": _peak_rss_mb(),
+            "children_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+            "worker_runs": self.worker_runs,
+            "worker_peak_rss_mb": self.worker_peak_rss_mb,
+            "pid": os.getpid(),
+            "stages": stages,
+        }, **extra)
+
+    def write(self, path, **extra):
+        report = self.report(**extra)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+# Process-wide profiler used by all instrumented modules
+PROFILER = Profiler()
+
+def run_profiled(func, *args):
+    """Worker-side wrapper: run func with profiling on, return (result, stats snapshot)."""
+    PROFILER.enable()
+    PROFILER.reset()
+    result = func(*args)
+    return result, PROFILER.snapshot()
+
+def submit_profiled(pool, func, *args):
+    """pool.submit(func, *args), collecting the worker's stage stats when profiling is on."""
+    if PROFILER.enabled:
+        return pool.submit(run_profiled, func, *args)
+    return pool.submit(func, *args)
+
+def profiled_result(future):
+    """Result of a submit_profiled future; merges the worker's stats into PROFILER."""
+    if not PROFILER.enabled:
+        return future.result()
+    result, snapshot = future.result()
+    PROFILER.merge(snapshot)
+    return result
+
+def print_summary(report):
+    """Compact stage table of a report(), slowest stages first."""
+    workers = f" (workers {report['worker_peak_rss_mb']} MB)" if report["worker_peak_rss_mb"] is not None else ""
+    print(f"⏱ Profile: {report['total_wall_s']:.3f}s wall, {report['total_cpu_s']:.3f}s CPU, "
+          f"peak RSS {report['peak_rss_mb']} MB{workers}")
+    for name, stats in sorted(report["stages"].items(), key=lambda item: -item[1]["wall_s"]):
+        counts = ", ".join(f"{key}={value}" for key, value in stats["counts"].items())
+        print(f"    {name:<28} {stats['calls']:>6} calls {stats['wall_s']:>9.3f}s wall {stats['cpu_s']:>9.3f}s CPU  {counts}")
@@ -22,22 +22,139 @@
 
 # ranker.py
 import numpy as np
-from persona_module import PersonaEmbedder
+from persona_module import get_embedder
+from profiling import PROFILER
+from dedup import embed_unique
 
-def cosine_similarity(a, b):
-    a = a / np.linalg.norm(a)
-    b = b / np.linalg.norm(b)
-    return np.dot(a, b)
+def order_by_score(scores, top_k=None):
+    """
+    Indices of scores from best to worst; ties keep input order.
+    With top_k only the best top_k are returned: np.partition finds the
+    k-th best score and every index scoring at least that is sorted, so
+    ties at the cut are broken by input order as in a full sort.
+    """
+    if top_k and top_k < len(scores):
+        kth = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+        selected = np.flatnonzero(scores >= kth)
+    else:
+        selected = np.arange(len(scores))
+    order = selected[np.argsort(-scores[selected], kind="stable")]
+    return order[:top_k] if top_k else order
 
-def rank_sections(candidates, persona_embedding):
-    embedder = PersonaEmbedder()
-    texts = [c["text"] for c in candidates]
-    embeddings = embedder.embed(texts)
+def rank_sections(candidates, persona_embedding, embedder=None, top_k=None, batch_size=None):
+    """
+    Sort candidates by similarity to the persona embedding.
+    Embeddings from PersonaEmbedder are unit-length, so cosine similarity
+    is a single matrix-vector product. Candidates may span many documents,
+    so ranks compare sections across the whole collection. With top_k only
+    the best top_k are returned.
+    batch_size overrides the embedder's sub-batch size. Repeated titles
+    are embedded and scored once (see dedup.embed_unique).
+    Uses the process-wide embedding engine unless one is passed in.
+    """
+    if not candidates:
+        return []
+    if embedder is None:
+        embedder = get_embedder()
 
-    scored = []
-    for i, emb in enumerate(embeddings):
-        score = cosine_similarity(emb, persona_embedding)
-        scored.append((score, candidates[i]))
+    with PROFILER.stage("rank_sections", sections=len(candidates)) as stage:
+        texts = [c["text"] for c in candidates]
+        embeddings, inverse = embed_unique(embedder, texts, batch_size=batch_size)
+        stage.count(unique_texts=len(embeddings))
+        scores = (embeddings @ np.asarray(persona_embedding, dtype=np.float32))[inverse]
+        return [candidates[i] for i in order_by_score(scores, top_k)]
 
-    scored.sort(reverse=True, key=lambda x: x[0])
-    return [s[1] for s in scored]
+def flatten_chunks(sections):
+    """
+    All chunk texts of all sections in order, plus the chunk count of each
+    section. Sections without body text fall back to their heading.
+    """
+    chunk_texts = []
+    counts = np.empty(len(sections), dtype=np.int64)
+    for i, sec in enumerate(sections):
+        chunks = sec.get("chunks") or [sec["text"]]
+        chunk_texts.extend(chunks)
+        counts[i] = len(chunks)
+    return chunk_texts, counts
+
+def rank_section_chunks(sections, persona_embedding, embedder=None, top_k=None, batch_size=None):
+    """
+    Rank sections by their best-matching body chunk.
+    Each section carries "chunks" (see sections.attach_sections); sections
+    without body text fall back to their heading. All chunks of all
+    sections are embedded in one batched call, each distinct chunk text
+    once, and scores are scattered back to every occurrence. Every returned section gets
+    "score" and "refined_text" (the text of its best chunk).
+    """
+    if not sections:
+        return []
+    if embedder is None:
+        embedder = get_embedder()
+
+    with PROFILER.stage("rank_sections", sections=len(sections)) as stage:
+        chunk_texts, counts = flatten_chunks(sections)
+        embeddings, inverse = embed_unique(embedder, chunk_texts, batch_size=batch_size)
+        stage.count(chunks=len(chunk_texts), unique_texts=len(embeddings))
+        scores = (embeddings @ np.asarray(persona_embedding, dtype=np.float32))[inverse]
+
+        # Best chunk per section: sort by (section, -score) and take each section's first row
+        section_ids = np.repeat(np.arange(len(sections)), counts)
+        order = np.lexsort((-scores, section_ids))
+        best = order[np.concatenate(([0], np.cumsum(counts)[:-1]))]
+        section_scores = scores[best]
+
+        for sec, chunk_index, score in zip(sections, best.tolist(), section_scores.tolist()):
+            sec["score"] = score
+            sec["refined_text"] = chunk_texts[chunk_index]
+        return [sections[i] for i in order_by_score(section_scores, top_k)]
+
+def rank_sections_multi(sections, persona_embeddings, embedder=None, top_k=None, batch_size=None, masks=None):
+    """
+    Rank the same sections for many personas at once. Distinct chunks are
+    embedded once and scored against every persona with a single matrix product;
+    each section takes its best chunk per persona, as in
+    rank_section_chunks. masks optionally restricts persona q to the
+    sections where masks[q] is True. Returns one ranked list per persona
+    of new section dicts carrying "score" and "refined_text".
+    """
+    personas = np.atleast_2d(np.asarray(persona_embeddings, dtype=np.float32))
+    if not sections:
+        return [[] for _ in personas]
+    if embedder is None:
+        embedder = get_embedder()
+
+    with PROFILER.stage("rank_sections", sections=len(sections), personas=len(personas)) as stage:
+        chunk_texts, counts = flatten_chunks(sections)
+        embeddings, inverse = embed_unique(embedder, chunk_texts, batch_size=batch_size)
+        stage.count(chunks=len(chunk_texts), unique_texts=len(embeddings))
+        return rank_embedded_chunks(sections, chunk_texts, counts, embeddings[inverse], personas, top_k, masks)
+
+def rank_embedded_chunks(sections, chunk_texts, counts, chunk_embeddings, persona_embeddings, top_k=None, masks=None):
+    """
+    Scoring half of rank_sections_multi for callers that embedded the
+    chunks from flatten_chunks(sections) themselves.
+    """
+    personas = np.atleast_2d(np.asarray(persona_embeddings, dtype=np.float32))
+    if not sections:
+        return [[] for _ in personas]
+    scores = np.asarray(chunk_embeddings, dtype=np.float32) @ personas.T  # (chunks, personas)
+
+    # Best chunk per section and persona; ties go to the earlier chunk
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    section_scores = np.maximum.reduceat(scores, starts, axis=0)
+    is_best = scores == np.repeat(section_scores, counts, axis=0)
+    rows = np.arange(len(chunk_texts))[:, None]
+    best_chunks = np.minimum.reduceat(np.where(is_best, rows, len(chunk_texts)), starts, axis=0)
+
+    rankings = []
+    for q in range(len(personas)):
+        selected = np.arange(len(sections)) if masks is None else np.flatnonzero(masks[q])
+        ranked = []
+        for i in selected[order_by_score(section_scores[selected, q], top_k)].tolist():
+            sec = dict(sections[i])
+            sec.pop("chunks", None)
+            sec["score"] = float(section_scores[i, q])
+            sec["refined_text"] = chunk_texts[best_chunks[i, q]]
+            ranked.append(sec)
+        rankings.append(ranked)
+    return rankings
@@ -0,0 +1,323 @@
+"""
+Persistent section index for answering many persona queries against one
+document collection.
+
+`build` runs extraction, heading detection and section chunking once and
+stores every chunk embedding with its section metadata. `query` then only
+embeds the persona and searches the stored vectors, so a query costs one
+model call plus a matrix-vector product instead of the full pipeline.
+
+Small collections are searched exactly. Above EXACT_SEARCH_LIMIT chunks
+an inverted-file (IVF) layout is added: chunks are clustered with
+spherical k-means, stored contiguously per cluster, and a query only
+scores the nprobe clusters whose centroids are closest to the persona.
+
+Layout of an index directory:
+    vectors.npy   float32 chunk embeddings, grouped by cluster (memory-mapped on load)
+    ivf.npz       owning section of each chunk, centroids and per-cluster row offsets
+    meta.json     sections, chunk texts, model fingerprint and indexed documents
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from cache import file_sha256, _write_json_atomic
+from dedup import embed_unique, collapse_boilerplate
+from outline_extractor import (
+    INPUT_DIR, OUTPUT_DIR, OUTPUT_FILE, collect_candidates, load_embedder,
+    load_persona_and_job, make_metadata, parse_args as parse_pipeline_args, write_output,
+)
+from ranker import flatten_chunks, order_by_score
+
+INDEX_VERSION = 1
+EXACT_SEARCH_LIMIT = 4096
+DEFAULT_NPROBE = 16
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLE_PER_LIST = 256
+
+def _assign(vectors, centroids, block=16384):
+    """Closest centroid (by dot product) of every row, computed in blocks to bound memory."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    similarity = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), block):
+        scores = vectors[start:start + block] @ centroids.T
+        labels[start:start + block] = scores.argmax(axis=1)
+        similarity[start:start + block] = scores.max(axis=1)
+    return labels, similarity
+
+def spherical_kmeans(vectors, n_clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    K-means on unit vectors using cosine similarity; centroids are
+    re-normalized after every update. Empty clusters are reseeded with the
+    rows that fit their current centroid worst.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels, similarity = _assign(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        present, starts = np.unique(labels[order], return_index=True)
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        updated = np.empty_like(centroids)
+        updated[present] = sums
+        empty = np.setdiff1d(np.arange(n_clusters), present)
+        if len(empty):
+            updated[empty] = vectors[np.argsort(similarity)[:len(empty)]]
+        updated /= np.maximum(np.linalg.norm(updated, axis=1, keepdims=True), 1e-12)
+        if np.array_equal(updated, centroids):
+            break
+        centroids = updated
+    return centroids
+
+def _model_fingerprint(model_path, known=None):
+    """[size, mtime_ns, sha256] of the model file; reuses known's hash when size and mtime match."""
+    stat = os.stat(model_path)
+    if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return known
+    return [stat.st_size, stat.st_mtime_ns, file_sha256(model_path)]
+
+def _document_stats(pdf_paths):
+    stats = {}
+    for path in pdf_paths:
+        stat = os.stat(path)
+        stats[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+class SectionIndex:
+    """
+    Chunk embeddings plus the section each chunk belongs to. Sections are
+    plain dicts with "document", "text" and "page", in collection order.
+    Rows of `vectors` are grouped by IVF list: list i owns rows
+    offsets[i]:offsets[i + 1]. Without IVF there is a single list.
+    """
+    VECTORS_FILE = "vectors.npy"
+    IVF_FILE = "ivf.npz"
+    META_FILE = "meta.json"
+
+    def __init__(self, vectors, owners, chunk_texts, sections, centroids=None, offsets=None, meta=None):
+        self.vectors = vectors
+        self.owners = owners
+        self.chunk_texts = chunk_texts
+        self.sections = sections
+        self.centroids = centroids
+        self.offsets = offsets if offsets is not None else np.array([0, len(vectors)], dtype=np.int64)
+        self.meta = meta or {}
+
+    @classmethod
+    def build(cls, sections, chunk_texts, vectors, counts, n_lists=None, seed=0):
+        """
+        Index chunk vectors (one row per chunk text, counts[i] rows for section i).
+        n_lists defaults to sqrt(#chunks) once the corpus exceeds
+        EXACT_SEARCH_LIMIT; 0 forces exact search.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        owners = np.repeat(np.arange(len(sections), dtype=np.int64), counts)
+        sections = [{"document": s["document"], "text": s["text"], "page": s["page"]} for s in sections]
+
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(vectors))) if len(vectors) > EXACT_SEARCH_LIMIT else 0
+        n_lists = min(n_lists, len(vectors))
+        if n_lists < 2:
+            return cls(vectors, owners, chunk_texts, sections)
+
+        # Train on a sample; assigning every row afterwards is a single pass
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), n_lists * KMEANS_SAMPLE_PER_LIST)
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        centroids = spherical_kmeans(sample, n_lists, seed=seed)
+        labels, _ = _assign(vectors, centroids)
+
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=n_lists))))
+        return cls(
+            vectors[order], owners[order], [chunk_texts[i] for i in order.tolist()], sections,
+            centroids=centroids, offsets=offsets,
+        )
+
+    def __len__(self):
+        return len(self.sections)
+
+    @property
+    def n_lists(self):
+        return len(self.offsets) - 1
+
+    def _candidate_rows(self, query, nprobe):
+        if self.centroids is None or nprobe >= self.n_lists:
+            return None
+        probed = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in probed])
+
+    def search(self, query_embedding, top_k=None, nprobe=DEFAULT_NPROBE):
+        """
+        Sections ranked by their best chunk's similarity to the query, as in
+        ranker.rank_section_chunks. With IVF only the nprobe closest lists
+        are scored; nprobe >= n_lists gives exact results. Returns new
+        section dicts with "score" and "refined_text".
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        rows = self._candidate_rows(query, nprobe)
+        if rows is None:
+            scores = self.vectors @ query
+            owners = self.owners
+        else:
+            scores = self.vectors[rows] @ query
+            owners = self.owners[rows]
+        if not len(scores):
+            return []
+
+        # Best chunk per section: sort by (section, -score) and take each section's first row
+        order = np.lexsort((-scores, owners))
+        section_ids, first = np.unique(owners[order], return_index=True)
+        best = order[first]
+        section_scores = scores[best]
+
+        results = []
+        for i in order_by_score(section_scores, top_k).tolist():
+            row = best[i] if rows is None else rows[best[i]]
+            sec = dict(self.sections[section_ids[i]])
+            sec["score"] = float(section_scores[i])
+            sec["refined_text"] = self.chunk_texts[row]
+            results.append(sec)
+        return results
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, self.VECTORS_FILE), self.vectors)
+        arrays = {"owners": self.owners, "offsets": self.offsets}
+        if self.centroids is not None:
+            arrays["centroids"] = self.centroids
+        np.savez(os.path.join(index_dir, self.IVF_FILE), **arrays)
+        meta = dict(self.meta, version=INDEX_VERSION, sections=self.sections, chunk_texts=self.chunk_texts)
+        # meta.json is written last, so a directory with it is a complete index
+        _write_json_atomic(os.path.join(index_dir, self.META_FILE), meta)
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir, cls.META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"{index_dir} holds index version {meta.get('version')}, expected {INDEX_VERSION}; rebuild it")
+        vectors = np.load(os.path.join(index_dir, cls.VECTORS_FILE), mmap_mode="r")
+        with np.load(os.path.join(index_dir, cls.IVF_FILE)) as arrays:
+            owners = arrays["owners"]
+            offsets = arrays["offsets"]
+            centroids = arrays["centroids"] if "centroids" in arrays else None
+        sections = meta.pop("sections")
+        chunk_texts = meta.pop("chunk_texts")
+        return cls(vectors, owners, chunk_texts, sections, centroids=centroids, offsets=offsets, meta=meta)
+
+    def check_model(self, model_path):
+        """Raise ValueError if the query model differs from the one the index was built with."""
+        known = self.meta.get("model")
+        if known and _model_fingerprint(model_path, known)[2] != known[2]:
+            raise ValueError("The index was built with a different embedding model; rebuild it")
+
+    def stale_documents(self, pdf_paths):
+        """Names of documents added, removed or modified since the index was built."""
+        indexed = self.meta.get("documents", {})
+        current = _document_stats(pdf_paths)
+        return sorted(name for name in indexed.keys() | current.keys() if indexed.get(name) != current.get(name))
+
+def build_index(args):
+    input_documents = sorted(
+        fname for fname in os.listdir(args.input_dir) if fname.lower().endswith(".pdf")
+    )
+    pdf_paths = [os.path.join(args.input_dir, fname) for fname in input_documents]
+
+    start = time.perf_counter()
+    workers = args.workers or os.cpu_count() or 1
+    candidates_per_doc = collect_candidates(
+        pdf_paths,
+        workers=workers,
+        threshold=args.heading_threshold,
+        cache_dir=os.path.join(args.cache_dir, "extraction") if args.cache_dir else None,
+        shard_pages=args.shard_pages,
+        section_chunks=None if args.titles_only else (args.chunk_words, args.max_chunks, args.chunk_tokens or None),
+        drop_repeated=not args.keep_repeated_lines,
+    )
+    if args.collapse_boilerplate:
+        candidates_per_doc = [collapse_boilerplate(c, args.collapse_boilerplate) for c in candidates_per_doc]
+    sections = [c for doc_candidates in candidates_per_doc for c in doc_candidates]
+
+    embedder = load_embedder(args)
+    chunk_texts, counts = flatten_chunks(sections)
+    unique_vectors, inverse = embed_unique(embedder, chunk_texts)
+    vectors = unique_vectors[inverse]
+    index = SectionIndex.build(sections, chunk_texts, vectors, counts, n_lists=args.n_lists)
+    index.meta = {
+        "model": _model_fingerprint(embedder.model_path),
+        "documents": _document_stats(pdf_paths),
+    }
+    index.save(args.index_dir)
+    mode = f"IVF with {index.n_lists} lists" if index.centroids is not None else "exact search"
+    print(f"📚 Indexed {len(index)} sections ({len(chunk_texts)} chunks) from {len(pdf_paths)} documents "
+          f"in {time.perf_counter() - start:.2f}s, {mode}")
+    print(f"✅ Index saved to {args.index_dir}")
+
+def query_index(args):
+    start = time.perf_counter()
+    index = SectionIndex.load(args.index_dir)
+    embedder = load_embedder(args)
+    index.check_model(embedder.model_path)
+    load_time = time.perf_counter() - start
+
+    input_documents = sorted(index.meta.get("documents", {}))
+    stale = index.stale_documents(
+        [os.path.join(args.input_dir, f) for f in os.listdir(args.input_dir) if f.lower().endswith(".pdf")]
+    ) if os.path.isdir(args.input_dir) else []
+    if stale:
+        print(f"⚠️ Index is out of date for: {', '.join(stale)} (rerun build)")
+
+    if args.persona and args.job:
+        persona, job = args.persona, args.job
+    else:
+        persona, job = load_persona_and_job(args.input_dir)
+    print(f"🧠 Persona: {persona}")
+    print(f"🎯 Job to be done: {job}")
+
+    start = time.perf_counter()
+    persona_emb = embedder.embed([f"{persona}. {job}"])[0]
+    embed_time = time.perf_counter() - start
+    start = time.perf_counter()
+    ranked = index.search(persona_emb, top_k=args.top_k, nprobe=args.nprobe)
+    search_time = time.perf_counter() - start
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    write_output(args.output, make_metadata(input_documents, persona, job), ranked)
+    print(f"⏱ Query: load {load_time * 1000:.1f}ms, persona embedding {embed_time * 1000:.1f}ms, "
+          f"search {search_time * 1000:.2f}ms over {len(index)} sections")
+    print(f"✅ Done. Final output saved to {args.output}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build or query a persistent section index")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("--index-dir", default=os.path.join(OUTPUT_DIR, "section_index"),
+                        help="Directory holding the index")
+    parser.add_argument("--input-dir", default=INPUT_DIR,
+                        help="Directory of PDFs to index (build) or to check for staleness (query)")
+    parser.add_argument("--n-lists", type=int, default=None,
+                        help=f"IVF lists (default: sqrt(#chunks) above {EXACT_SEARCH_LIMIT} chunks, else exact search; 0 = exact)")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE,
+                        help="IVF lists scored per query")
+    parser.add_argument("--persona", default=None, help="Query persona (default: from the input JSON)")
+    parser.add_argument("--job", default=None, help="Query job to be done (default: from the input JSON)")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Where query results are written")
+    # Extraction and embedding options are shared with outline_extractor.py
+    args, rest = parser.parse_known_args()
+    pipeline_args = parse_pipeline_args(rest)
+    for name, value in vars(pipeline_args).items():
+        setattr(args, name, value)
+    return args
+
+def main():
+    args = parse_args()
+    if args.command == "build":
+        build_index(args)
+    else:
+        query_index(args)
+
+if __name__ == "__main__":
+    main()
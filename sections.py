@@ -0,0 +1,76 @@
+"""
+Section segmentation: attach the body text that follows each detected
+heading and split it into chunks small enough to embed.
+
+A section runs from its heading line up to the next detected heading of
+the same document (BlockTable rows are in reading order). Chunks are
+bounded by wordpiece tokens, counted with the embedder's tokenizer
+(model/tokenizer) and including [CLS]/[SEP]: the default of 128 is the
+sequence length MiniLM was trained on. Chunks are also capped at a number
+of whitespace-separated words, which bounds how much text is tokenized.
+With max_tokens=None the word count alone is used as a stand-in for
+tokens.
+"""
+CHUNK_WORDS = 96
+CHUNK_TOKENS = 128
+MAX_CHUNKS = 3
+
+# [CLS] and [SEP] added around every embedded text
+SPECIAL_TOKENS = 2
+
+_TOKENIZER = None
+
+def word_token_counts(words):
+    """Wordpiece tokens of each word, from the shared tokenizer loaded on first use."""
+    global _TOKENIZER
+    if _TOKENIZER is None:
+        from persona_module import DEFAULT_TOKENIZER_PATH, load_tokenizer
+        _TOKENIZER = load_tokenizer(DEFAULT_TOKENIZER_PATH)[0]
+    return [len(e.ids) for e in _TOKENIZER.encode_batch(words, add_special_tokens=False)]
+
+def chunk_words(words, chunk_size=CHUNK_WORDS, max_chunks=MAX_CHUNKS, max_tokens=CHUNK_TOKENS):
+    """
+    Split a word list into at most max_chunks strings of up to chunk_size
+    words and max_tokens tokens. The BERT pre-tokenizer splits on
+    whitespace, so a chunk's tokens are the sum over its words; a single
+    word longer than max_tokens becomes its own chunk.
+    """
+    if max_tokens is None:
+        return [
+            " ".join(words[start:start + chunk_size])
+            for start in range(0, min(len(words), chunk_size * max_chunks), chunk_size)
+        ]
+
+    budget = max_tokens - SPECIAL_TOKENS
+    chunks = []
+    start = tokens = 0
+    for i, count in enumerate(word_token_counts(words)):
+        if i > start and (i - start >= chunk_size or tokens + count > budget):
+            chunks.append(" ".join(words[start:i]))
+            if len(chunks) == max_chunks:
+                return chunks
+            start, tokens = i, 0
+        tokens += count
+    if start < len(words):
+        chunks.append(" ".join(words[start:]))
+    return chunks
+
+def attach_sections(candidates, blocks, chunk_size=CHUNK_WORDS, max_chunks=MAX_CHUNKS, max_tokens=CHUNK_TOKENS):
+    """
+    Give every candidate a "chunks" list built from the body lines between
+    it and the next candidate. Candidates must carry "block_index" (see
+    utils.classify_headings); it is removed once used. Only as many words as
+    max_chunks can hold are gathered, so long sections stay cheap.
+    """
+    candidates.sort(key=lambda c: c["block_index"])
+    word_budget = chunk_size * max_chunks
+    for i, candidate in enumerate(candidates):
+        start = candidate.pop("block_index") + 1
+        stop = candidates[i + 1]["block_index"] if i + 1 < len(candidates) else len(blocks)
+        words = []
+        for text in blocks.text[start:stop]:
+            words.extend(text.split())
+            if len(words) >= word_budget:
+                break
+        candidate["chunks"] = chunk_words(words[:word_budget], chunk_size, max_chunks, max_tokens)
+    return candidates
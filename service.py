@@ -0,0 +1,378 @@
+"""
+Resident ranking service: keeps the heading detector, the embedding
+session and per-document results warm between requests, so a request
+pays neither import time nor model loading.
+
+    python service.py --port 8080 [outline_extractor.py flags]
+
+Endpoints:
+    GET  /health   status and counters
+    POST /rank     challenge output JSON for one persona request
+
+The /rank body is a challenge input JSON (persona.role,
+job_to_be_done.task, documents[].filename) or the short form
+{"persona": ..., "job": ..., "documents": [...], "top_k": N}. Documents
+name PDFs in --input-dir, or upload them as {"filename": ..., "content":
+<base64>}.
+
+Extraction and heading detection run in a process pool (forked before
+the ONNX session exists, as in outline_extractor.py). Each document's
+sections and chunk embeddings are kept in memory keyed by path, size and
+mtime, so a repeated document costs nothing. Embedding calls from
+concurrent requests are merged into shared batches by MicroBatcher.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import tempfile
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from outline_extractor import (
+    INPUT_DIR, HEADING_MODEL_PATH, _init_worker, _detect_in_worker, build_output,
+    load_embedder, make_metadata, parse_persona_and_job, parse_args as parse_pipeline_args,
+)
+from ranker import flatten_chunks, rank_embedded_chunks
+from dedup import default_key, unique_texts, collapse_boilerplate
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+class RequestError(Exception):
+    """Client error reported with an HTTP status."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class MicroBatcher:
+    """
+    Merge embedding calls that arrive close together into one embedder
+    call. A batch is sent once max_texts texts are queued or max_wait
+    seconds passed since its first call. Inference runs on a single
+    thread, so the embedder and its cache are never used concurrently.
+    """
+    def __init__(self, embedder, max_texts=512, max_wait=0.005):
+        self.embedder = embedder
+        self.max_texts = max_texts
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.thread = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.calls = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def embed(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_texts:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            # Texts repeated within or across the merged calls are embedded once
+            unique, inverse = unique_texts(texts, key=getattr(self.embedder, "text_key", default_key))
+            try:
+                embeddings = (await loop.run_in_executor(self.thread, self.embedder.embed, unique))[inverse]
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.calls += len(batch)
+            offset = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+class DocumentStore:
+    """
+    LRU of processed documents: sections, chunk texts, chunk counts and
+    chunk embeddings, keyed by (path, size, mtime_ns). Concurrent requests
+    for the same uncached document share one extraction. With
+    collapse_boilerplate=N, headings repeated on N or more pages are
+    collapsed before embedding (see dedup.collapse_boilerplate). A PDF
+    that cannot be extracted is reported as a 400 RequestError.
+    """
+    def __init__(self, pool, batcher, max_entries=256, collapse_boilerplate=0):
+        self.pool = pool
+        self.batcher = batcher
+        self.max_entries = max_entries
+        self.collapse_boilerplate = collapse_boilerplate
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, path, name=None):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if key not in self.pending:
+            self.misses += 1
+            self.pending[key] = asyncio.ensure_future(self._process(path, name or os.path.basename(path)))
+        try:
+            entry = await asyncio.shield(self.pending[key])
+        finally:
+            self.pending.pop(key, None)
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    async def _process(self, path, name):
+        loop = asyncio.get_running_loop()
+        try:
+            sections = await loop.run_in_executor(self.pool, _detect_in_worker, path)
+        except BrokenExecutor:
+            raise
+        except Exception as exc:
+            raise RequestError(400, f"Could not extract {name}: {type(exc).__name__}")
+        if self.collapse_boilerplate:
+            sections = collapse_boilerplate(sections, self.collapse_boilerplate)
+        chunk_texts, counts = flatten_chunks(sections)
+        embeddings = await self.batcher.embed(chunk_texts) if chunk_texts else None
+        return sections, chunk_texts, counts, embeddings
+
+class RankingService:
+    def __init__(self, args):
+        self.args = args
+        self.input_dir = args.input_dir
+        self.spool_dir = args.spool_dir or tempfile.mkdtemp(prefix="ranking-uploads-")
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        # Fork the extraction workers before the ONNX session exists
+        workers = args.workers or os.cpu_count() or 1
+        section_chunks = None if args.titles_only else (args.chunk_words, args.max_chunks, args.chunk_tokens or None)
+        cache_dir = os.path.join(args.cache_dir, "extraction") if args.cache_dir else None
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(HEADING_MODEL_PATH, args.heading_threshold, cache_dir, section_chunks,
+                      not args.keep_repeated_lines),
+        )
+        self.pool.submit(os.getpid).result()
+        self.embedder = load_embedder(args)
+        self.batcher = None
+        self.documents = None
+        self.requests = 0
+
+    def start(self):
+        self.batcher = MicroBatcher(self.embedder, self.args.max_batch_texts, self.args.batch_wait_ms / 1000)
+        self.batcher.start()
+        self.documents = DocumentStore(self.pool, self.batcher, self.args.document_cache_size,
+                                       self.args.collapse_boilerplate)
+
+    def resolve(self, document):
+        """(path, display name) of one request document, spooling uploaded content."""
+        if isinstance(document, str):
+            document = {"filename": document}
+        if not isinstance(document, dict):
+            raise RequestError(400, f"Invalid document entry: {document!r}")
+        name = document.get("filename")
+        if not isinstance(name, str) or not name or os.path.basename(name) != name:
+            raise RequestError(400, f"Invalid document filename: {name!r}")
+        if "content" not in document:
+            path = os.path.join(self.input_dir, name)
+            if not os.path.isfile(path):
+                raise RequestError(404, f"Document not found: {name}")
+            return path, name
+        try:
+            content = base64.b64decode(document["content"], validate=True)
+        except (binascii.Error, TypeError) as exc:
+            raise RequestError(400, f"Invalid base64 content for {name}: {exc}")
+        path = os.path.join(self.spool_dir, hashlib.sha256(content).hexdigest() + ".pdf")
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return path, name
+
+    async def rank(self, body):
+        try:
+            if isinstance(body.get("persona"), dict):
+                persona, job = parse_persona_and_job(body)
+            else:
+                persona, job = body["persona"], body["job"]
+            documents = body["documents"]
+        except (KeyError, TypeError) as exc:
+            raise RequestError(400, f"Missing request field: {exc}")
+        if not isinstance(documents, list):
+            raise RequestError(400, "documents must be a list")
+        if not documents:
+            raise RequestError(400, "No documents given")
+        top_k = body.get("top_k", self.args.top_k)
+        if top_k is not None and (not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1):
+            raise RequestError(400, f"top_k must be a positive integer or null, got {top_k!r}")
+        resolved = [self.resolve(document) for document in documents]
+
+        entries = await asyncio.gather(*(self.documents.get(path, name) for path, name in resolved))
+        persona_emb = await self.batcher.embed([f"{persona}. {job}"])
+
+        # Concatenate the cached per-document sections; sections name their document by file name
+        sections, chunk_texts, counts, embeddings = [], [], [], []
+        for (path, name), (doc_sections, doc_chunks, doc_counts, doc_embeddings) in zip(resolved, entries):
+            if not doc_sections:
+                continue
+            sections.extend(dict(sec, document=name) for sec in doc_sections)
+            chunk_texts.extend(doc_chunks)
+            counts.append(doc_counts)
+            embeddings.append(doc_embeddings)
+        if sections:
+            ranked = rank_embedded_chunks(
+                sections, chunk_texts, np.concatenate(counts), np.concatenate(embeddings), persona_emb, top_k,
+            )[0]
+        else:
+            ranked = []
+        self.requests += 1
+        return build_output(make_metadata([name for _, name in resolved], persona, job), ranked)
+
+    def health(self):
+        return {
+            "status": "ok",
+            "requests": self.requests,
+            "documents_cached": len(self.documents.entries),
+            "document_hits": self.documents.hits,
+            "document_misses": self.documents.misses,
+            "embedding_batches": self.batcher.batches,
+            "embedding_calls": self.batcher.calls,
+            "embedder": self.embedder.timing_report(),
+        }
+
+    async def handle(self, reader, writer):
+        start = time.perf_counter()
+        try:
+            status, payload = await self._dispatch(reader)
+        except RequestError as exc:
+            status, payload = exc.status, {"error": str(exc)}
+        except Exception as exc:
+            traceback.print_exc()
+            status, payload = 500, {"error": f"{type(exc).__name__}: {exc}"}
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"X-Processing-Time-Ms: {(time.perf_counter() - start) * 1000:.1f}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            raise RequestError(400, "Malformed request head")
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise RequestError(400, "Malformed request line")
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        path = target.split("?", 1)[0]
+
+        if path == "/health":
+            if method != "GET":
+                raise RequestError(405, "Use GET")
+            return 200, self.health()
+        if path != "/rank":
+            raise RequestError(404, f"Unknown path: {path}")
+        if method != "POST":
+            raise RequestError(405, "Use POST")
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise RequestError(400, f"Invalid Content-Length: {headers['content-length']!r}")
+        if length < 0:
+            raise RequestError(400, f"Invalid Content-Length: {length}")
+        if length > self.args.max_body_mb * (1 << 20):
+            raise RequestError(413, f"Body larger than {self.args.max_body_mb} MB")
+        try:
+            body = json.loads(await reader.readexactly(length))
+        except (asyncio.IncompleteReadError, ValueError) as exc:
+            raise RequestError(400, f"Invalid JSON body: {exc}")
+        if not isinstance(body, dict):
+            raise RequestError(400, "Body must be a JSON object")
+        return 200, await self.rank(body)
+
+async def serve(service, host, port):
+    service.start()
+    server = await asyncio.start_server(service.handle, host, port, limit=1 << 16)
+    print(f"🚀 Serving on http://{host}:{port} (POST /rank, GET /health)")
+    async with server:
+        await server.serve_forever()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Resident persona ranking service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--input-dir", default=INPUT_DIR,
+                        help="Directory that documents given by file name are read from")
+    parser.add_argument("--spool-dir", default=None,
+                        help="Where uploaded PDFs are stored by content hash (default: a temporary directory)")
+    parser.add_argument("--document-cache-size", type=int, default=256,
+                        help="Processed documents kept in memory")
+    parser.add_argument("--max-batch-texts", type=int, default=512,
+                        help="Texts per shared embedding call")
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0,
+                        help="How long an embedding call waits for others to join its batch")
+    parser.add_argument("--max-body-mb", type=float, default=64,
+                        help="Largest accepted request body")
+    # Extraction and embedding options are shared with outline_extractor.py
+    args, rest = parser.parse_known_args()
+    for name, value in vars(parse_pipeline_args(rest)).items():
+        setattr(args, name, value)
+    return args
+
+def main():
+    args = parse_args()
+    service = RankingService(args)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.pool.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Streaming variant of the outline_extractor pipeline with bounded memory.
+
+Pages are parsed one at a time and only lines that pass the heading
+heuristics are kept (see stream_candidates); candidates are embedded in rolling batches and every
+scored section is written out immediately, as JSON Lines or as a streamed
+JSON array. Because sections are emitted as soon as they are scored, each
+record carries its similarity score instead of a global importance_rank.
+"""
+import json
+
+import numpy as np
+
+from dedup import embed_unique
+from extract_candidates import BlockTable, scan_body_style, iter_candidate_blocks
+from utils import classify_headings
+
+def stream_candidates(pdf_path, detector, document, threshold=None, min_length=3, max_length=100,
+                      sample_pages=None, drop_repeated=True):
+    """
+    Yield the heading candidates of one PDF using two-pass extraction.
+
+    Pass one reads only span metadata to get body font/color and the
+    running header/footer fingerprints (optionally from a sample of pages);
+    pass two keeps only lines that pass every heuristic and are not running
+    headers/footers (unless drop_repeated is False), so memory scales
+    with the number of headings.
+    """
+    body_font, body_color, repeated = scan_body_style(pdf_path, sample_pages=sample_pages)
+    survivors = BlockTable.concatenate(
+        iter_candidate_blocks(pdf_path, body_font, body_color, min_length, max_length,
+                              repeated if drop_repeated else None)
+    )
+    yield from classify_headings(detector, survivors, body_font, body_color, document, threshold)
+
+def iter_scored(candidates, embedder, persona_embedding, batch_size=256):
+    """Embed candidates in rolling batches and yield (candidate, score) pairs."""
+    persona_embedding = np.asarray(persona_embedding, dtype=np.float32)
+    batch = []
+    for candidate in candidates:
+        batch.append(candidate)
+        if len(batch) >= batch_size:
+            yield from _score_batch(batch, embedder, persona_embedding)
+            batch = []
+    if batch:
+        yield from _score_batch(batch, embedder, persona_embedding)
+
+def _score_batch(batch, embedder, persona_embedding):
+    embeddings, inverse = embed_unique(embedder, [c["text"] for c in batch])
+    scores = (embeddings @ persona_embedding)[inverse]
+    return zip(batch, scores.tolist())
+
+class StreamWriter:
+    """
+    Incremental output writer.
+    "jsonl": a {"metadata": ...} line followed by one section per line.
+    "json":  {"metadata": ..., "extracted_sections": [...]} with the array streamed.
+    """
+
+    def __init__(self, path, metadata, fmt="jsonl"):
+        if fmt not in ("jsonl", "json"):
+            raise ValueError(f"Unknown stream format: {fmt}")
+        self.fmt = fmt
+        self.count = 0
+        self._f = open(path, "w", encoding="utf-8")
+        if fmt == "jsonl":
+            self._f.write(json.dumps({"metadata": metadata}, ensure_ascii=False) + "\n")
+        else:
+            self._f.write('{"metadata": ' + json.dumps(metadata, ensure_ascii=False) + ',\n "extracted_sections": [')
+
+    def write(self, section):
+        line = json.dumps(section, ensure_ascii=False)
+        if self.fmt == "jsonl":
+            self._f.write(line + "\n")
+        else:
+            self._f.write(("," if self.count else "") + "\n  " + line)
+        self.count += 1
+
+    def close(self):
+        if self.fmt == "json":
+            self._f.write("\n ]\n}\n")
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,3 +1,4 @@
+# One-off download script; needs transformers, which the runtime no longer installs
 from transformers import AutoTokenizer
 
 # Download and save tokenizer to a local folder
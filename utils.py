@@ -1,21 +1,171 @@
-import joblib
+import math
+import os
+
+import numpy as np
+
+from profiling import PROFILER
+
+# heading_model.npz is exported from the pickle by convert_heading_model.py
+ARRAY_MODEL_PATH = "model/heading_model.npz"
+PICKLED_MODEL_PATH = "model/heading_model.pkl"
+
+# Column order expected by the scaler/classifier in heading_model.pkl
+FEATURE_NAMES = (
+    "font_size",
+    "is_bold",
+    "x",
+    "y",
+    "char_length",
+    "body_font_size",
+    "font_ratio",
+)
+
+class LinearHeadingModel:
+    """
+    StandardScaler + binary LogisticRegression as plain arrays. Reproduces
+    scikit-learn's arithmetic step for step (in-place scaling in the input
+    dtype, float64 decision function, expit of the decision for probabilities),
+    so predictions match the pickle exactly without importing scikit-learn.
+    """
+    def __init__(self, mean, scale, coef, intercept, classes):
+        self.mean = mean
+        self.scale = scale
+        self.coef = coef
+        self.intercept = intercept
+        self.classes = classes
+
+    @classmethod
+    def load(cls, path=ARRAY_MODEL_PATH):
+        with np.load(path) as arrays:
+            return cls(arrays["mean"], arrays["scale"], arrays["coef"], arrays["intercept"], arrays["classes"])
+
+    @classmethod
+    def from_sklearn(cls, scaler, model):
+        if len(model.classes_) != 2:
+            raise ValueError("Only binary classifiers can be converted")
+        return cls(scaler.mean_, scaler.scale_, model.coef_, model.intercept_, model.classes_)
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, scale=self.scale, coef=self.coef,
+                 intercept=self.intercept, classes=self.classes, feature_names=np.array(FEATURE_NAMES))
+
+    def decision_function(self, X) -> np.ndarray:
+        X = np.array(X, copy=True)
+        X -= self.mean.astype(X.dtype)
+        X /= self.scale.astype(X.dtype)
+        return (X @ self.coef.T + self.intercept).reshape(-1)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes[(self.decision_function(X) > 0).astype(int)]
+
+    def predict_proba(self, X) -> np.ndarray:
+        decision = self.decision_function(X)
+        # scipy.special.expit uses libm's exp; NumPy's vectorized exp can differ by one ulp
+        exp = np.fromiter((math.exp(-d) if d > -709.78 else math.inf for d in decision.tolist()),
+                          dtype=np.float64, count=len(decision))
+        positive = 1.0 / (1.0 + exp)
+        return np.column_stack((1 - positive, positive))
 
 class HeadingDetector:
-    def __init__(self, model_path="model/heading_model.pkl"):
-        self.scaler, self.model = joblib.load(model_path)
+    def __init__(self, model_path=None):
+        """
+        model_path is a heading_model.npz (NumPy only) or a pickled
+        (scaler, model) tuple. By default the npz is used when present,
+        else the pickle.
+        """
+        if model_path is None:
+            model_path = ARRAY_MODEL_PATH if os.path.exists(ARRAY_MODEL_PATH) else PICKLED_MODEL_PATH
+        if model_path.endswith(".npz"):
+            self.model = LinearHeadingModel.load(model_path)
+        else:
+            import joblib  # pulls in scikit-learn; only the pickle fallback pays for it
+
+            self.model = LinearHeadingModel.from_sklearn(*joblib.load(model_path))
+        self._positive_column = list(self.model.classes).index(1)
+
+    @staticmethod
+    def build_features(blocks, body_font, body_color) -> np.ndarray:
+        """
+        Feature matrix (float32, FEATURE_NAMES order) of a BlockTable from one
+        document, built column by column. is_bold is the effective bolding:
+        bold font or a color other than the body color.
+        """
+        X = np.empty((len(blocks), len(FEATURE_NAMES)), dtype=np.float32)
+        if not len(blocks):
+            return X
+        X[:, 0] = blocks.font_size
+        X[:, 1] = (blocks.is_bold != 0) | (blocks.text_color != body_color)
+        X[:, 2] = blocks.x
+        X[:, 3] = blocks.y
+        X[:, 4] = blocks.char_length
+        X[:, 5] = body_font
+        return _add_font_ratio(X)
+
+    @staticmethod
+    def features_from_dicts(rows) -> np.ndarray:
+        """Feature matrix of {"font_size", "is_bold", "x", "y", "char_length", "body_font_size"} dicts."""
+        X = np.empty((len(rows), len(FEATURE_NAMES)), dtype=np.float32)
+        if not rows:
+            return X
+        X[:, :6] = [
+            (r["font_size"], r["is_bold"], r["x"], r["y"], r["char_length"], r["body_font_size"])
+            for r in rows
+        ]
+        return _add_font_ratio(X)
+
+    def predict_features(self, X, threshold=None) -> np.ndarray:
+        """
+        Classify every row of a feature matrix with one batched scaling +
+        matrix-vector product. Returns a boolean mask; with a threshold, uses
+        predict_proba instead of predict. Rows may come from different
+        documents as each carries its own body_font_size.
+        """
+        if not len(X):
+            return np.zeros(0, dtype=bool)
+
+        with PROFILER.stage("heading_detector") as stage:
+            if threshold is None:
+                mask = self.model.predict(X) == 1
+            else:
+                mask = self.model.predict_proba(X)[:, self._positive_column] >= threshold
+            stage.count(blocks=len(X), headings=int(mask.sum()))
+        PROFILER.batch("heading_detector", len(X))
+        return mask
+
+    def predict_batch(self, blocks, body_font, body_color, threshold=None) -> np.ndarray:
+        """Heading mask over a BlockTable from one document."""
+        return self.predict_features(self.build_features(blocks, body_font, body_color), threshold)
 
     def is_heading(self, block: dict) -> bool:
-        font_ratio = block["font_size"] / block["body_font_size"] if block["body_font_size"] else 1.0
-
-        features = [[
-            block["font_size"],
-            block["is_bold"],
-            block["x"],
-            block["y"],
-            block["char_length"],
-            block["body_font_size"],
-            font_ratio
-        ]]
-
-        X = self.scaler.transform(features)
-        return self.model.predict(X)[0] == 1
+        return bool(self.predict_features(self.features_from_dicts([block]))[0])
+
+def _add_font_ratio(X):
+    """Fill the font_ratio column from font_size / body_font_size (1 where the body size is 0)."""
+    body = X[:, 5]
+    X[:, 6] = np.divide(X[:, 0], body, out=np.ones_like(body), where=body != 0)
+    return X
+
+def classify_headings(detector, blocks, body_font, body_color, document, threshold=None, indices=None):
+    """
+    Run the classifier over a BlockTable of one document's heuristic
+    survivors and return the heading candidates as {"text", "page",
+    "font_size", "document"} dicts. If indices (the rows' positions in the
+    document) is given, each candidate also records its "block_index".
+    """
+    mask = detector.predict_batch(blocks, body_font, body_color, threshold=threshold)
+    selected = np.flatnonzero(mask)
+    pages = blocks.page[selected].tolist()
+    font_sizes = blocks.font_size[selected].tolist()
+    block_indices = np.asarray(indices)[selected].tolist() if indices is not None else None
+    candidates = []
+    for n, i in enumerate(selected.tolist()):
+        candidate = {
+            "text": blocks.text[i],
+            "page": pages[n],
+            "font_size": font_sizes[n],
+            "document": document
+        }
+        if block_indices is not None:
+            candidate["block_index"] = block_indices[n]
+        candidates.append(candidate)
+    return candidates